@@ -0,0 +1 @@
+"""Benchmarks for lamarr_energy_tracker"""
@@ -0,0 +1,49 @@
+"""
+Compares the number and cost of power measurements with a fixed and with an adaptive sampling interval
+"""
+import argparse
+import tempfile
+import time
+
+from lamarr_energy_tracker import EnergyTracker
+
+
+def workload(duration, phase=5.0):
+    """Alternates between busy and idle phases, to provoke power changes"""
+    t_end = time.perf_counter() + duration
+    while time.perf_counter() < t_end:
+        t_phase = min(time.perf_counter() + phase, t_end)
+        while time.perf_counter() < t_phase:
+            sum(i * i for i in range(1000))
+        time.sleep(max(min(phase, t_end - time.perf_counter()), 0))
+
+
+def run(output_dir, duration, min_interval, max_interval, tolerance):
+    """Sampling statistics of running the workload with the fixed minimum interval and with the adaptive interval"""
+    results = {}
+    for name, max_secs in [('fixed', None), ('adaptive', max_interval)]:
+        tracker = EnergyTracker(project_name="bench_adaptive", output_dir=output_dir, measure_power_secs=min_interval, max_measure_power_secs=max_secs, sampling_tolerance=tolerance)
+        tracker.start()
+        cpu_start, thread_start = time.process_time(), time.thread_time()
+        workload(duration)
+        # CPU time of the whole process except for the workload in this thread, i.e., of the measurements and CodeCarbon's utilization monitoring
+        cpu_time = (time.process_time() - cpu_start) - (time.thread_time() - thread_start)
+        energy, _ = tracker.stop(print_summary=False)
+        results[name] = dict(tracker.sampling, energy=energy, sampling_s=tracker.tracker.sampling_seconds, cpu_s=cpu_time)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the adaptive sampling interval of the EnergyTracker.")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of alternating busy and idle phases per run")
+    parser.add_argument("--min_interval", type=float, default=0.5, help="Fixed interval and lower bound of the adaptive interval")
+    parser.add_argument("--max_interval", type=float, default=30, help="Upper bound of the adaptive interval")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Relative integration error per interval")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = run(output_dir, args.duration, args.min_interval, args.max_interval, args.tolerance)
+    for name, stats in results.items():
+        print(f"{name:>9}: {stats['samples']:6d} measurements, {stats['sampling_s'] * 1e3:8.1f} ms measuring, {stats['cpu_s'] * 1e3:8.1f} ms CPU outside the workload, "
+              f"{stats['energy'] * 1e3:8.4f} Wh, estimated error {stats['estimated_error'] * 1e3:8.5f} Wh")
+    print(f"measurements saved: {1 - results['adaptive']['samples'] / results['fixed']['samples']:.1%}")
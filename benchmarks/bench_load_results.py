@@ -0,0 +1,73 @@
+"""
+Compares the original load_results implementation with the vectorized, typed loading path
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import pandas as pd
+
+from lamarr_energy_tracker.print_paper_statement import load_results
+from benchmarks.synthetic import write_synthetic_results
+
+
+def legacy_load_results(output_dir, project_name=None, user=None, hostname=None):
+    """The load_results implementation prior to the vectorized loading path"""
+    results = pd.read_csv(os.path.join(output_dir, 'emissions.csv'))
+    for idx, field in enumerate(['project_name', 'user', 'hostname']):
+        results[field] = results['experiment_id'].apply(lambda x: x.split('___')[idx])
+    if project_name is not None:
+        results = results[results['project_name'] == project_name]
+    if user is not None:
+        results = results[results['user'] == user]
+    if hostname is not None:
+        results = results[results['hostname'] == hostname]
+    return results
+
+
+def _measure(func, args, kwargs):
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t_start = time.perf_counter()
+    result = func(*args, **kwargs)
+    duration = time.perf_counter() - t_start
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return len(result), duration, (rss_peak - rss_start) / 1e3 # ru_maxrss is given in KB
+
+
+def in_subprocess(func, *args, **kwargs):
+    """Calls func in a fresh process, the peak memory of which is inherited by all processes spawned later on"""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(func, *args, **kwargs).result()
+
+
+def measure(func, *args, **kwargs):
+    """Returns the number of rows, wall time (in seconds) and peak memory increase (in MB) of calling func"""
+    return in_subprocess(_measure, func, args, kwargs)
+
+
+def run(output_dir, columns=('energy_consumed', 'emissions', 'codecarbon_version', 'cpu_model', 'gpu_model')):
+    filters = dict(project_name='project1', user='user1', hostname='host1')
+    measurements = {
+        'legacy': measure(legacy_load_results, output_dir, **filters),
+        'typed': measure(load_results, output_dir, **filters),
+        'typed+projection': measure(load_results, output_dir, columns=list(columns), **filters),
+    }
+    return {name: {'seconds': duration, 'peak_mb': peak, 'rows': rows} for name, (rows, duration, peak) in measurements.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks load_results on a synthetic emissions.csv file.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of synthetic result rows")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        in_subprocess(write_synthetic_results, os.path.join(output_dir, 'emissions.csv'), args.rows)
+        timings = run(output_dir)
+    baseline = timings['legacy']
+    for name, stats in timings.items():
+        print(f"{name:>18}: {stats['seconds']:7.3f} s ({baseline['seconds']/stats['seconds']:5.1f}x), "
+              f"peak {stats['peak_mb']:8.1f} MB ({baseline['peak_mb']/stats['peak_mb']:5.1f}x), {stats['rows']} rows")
@@ -0,0 +1,46 @@
+"""
+Compares a sequential loop over the output directories of many hosts with the parallel merged loading
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from lamarr_energy_tracker.print_paper_statement import load_results, load_summary
+from lamarr_energy_tracker.results_store import SUMMARY_KEYS, SUMMARY_VALUES, aggregate_results
+from benchmarks.synthetic import write_synthetic_results
+
+
+def sequential_summary(output_dirs):
+    """Loads and concatenates the results of all directories one after another"""
+    results = pd.concat([load_results(output_dir, columns=SUMMARY_KEYS + SUMMARY_VALUES) for output_dir in output_dirs])
+    return aggregate_results(results)
+
+
+def run(root, n_hosts):
+    output_dirs = [os.path.join(root, f'host{idx}') for idx in range(n_hosts)]
+    timings = {}
+    t_start = time.perf_counter()
+    sequential_summary(output_dirs)
+    timings['sequential'] = time.perf_counter() - t_start
+    t_start = time.perf_counter()
+    load_summary(os.path.join(root, 'host*'))
+    timings['parallel'] = time.perf_counter() - t_start
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks fleet-wide summaries over the output directories of many hosts.")
+    parser.add_argument("--hosts", type=int, default=100, help="Number of host output directories")
+    parser.add_argument("--rows", type=int, default=20_000, help="Number of synthetic result rows per host")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        for idx in range(args.hosts):
+            os.makedirs(os.path.join(root, f'host{idx}'))
+            write_synthetic_results(os.path.join(root, f'host{idx}', 'emissions.csv'), args.rows, seed=idx)
+        timings = run(root, args.hosts)
+    for name, seconds in timings.items():
+        print(f"{name:>10}: {seconds:7.3f} s ({timings['sequential']/seconds:5.1f}x)")
@@ -0,0 +1,38 @@
+"""
+Measures the overhead of section boundaries within a running EnergyTracker
+"""
+import argparse
+import tempfile
+import time
+
+from lamarr_energy_tracker import EnergyTracker
+
+
+def run(output_dir, n_sections=1000):
+    """Returns the mean overhead (in microseconds) per section boundary, with and without measuring at the boundaries"""
+    overhead = {}
+    tracker = EnergyTracker(project_name="bench_sections", output_dir=output_dir)
+    tracker.start()
+    for measure in [False, True]:
+        t_start = time.perf_counter()
+        for idx in range(n_sections):
+            with tracker.section(f"section{idx}", measure=measure):
+                pass
+        # every section has two boundaries
+        overhead['measure' if measure else 'snapshot'] = (time.perf_counter() - t_start) / (2 * n_sections) * 1e6
+    t_start = time.perf_counter()
+    tracker.stop(print_summary=False)
+    overhead['store_all'] = (time.perf_counter() - t_start) * 1e6
+    return overhead
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the overhead of EnergyTracker sections.")
+    parser.add_argument("--sections", type=int, default=1000, help="Number of measured sections")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        overhead = run(output_dir, args.sections)
+    print(f"snapshot at boundary:     {overhead['snapshot']:9.1f} us per boundary")
+    print(f"measurement at boundary:  {overhead['measure']:9.1f} us per boundary")
+    print(f"storing {2 * args.sections} sections on stop: {overhead['store_all'] / 1e3:9.1f} ms")
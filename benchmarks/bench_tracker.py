@@ -0,0 +1,171 @@
+"""
+Benchmark suite for the overhead of the EnergyTracker itself, with JSON output for tracking regressions
+"""
+import argparse
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_load_results import in_subprocess
+from benchmarks.synthetic import write_synthetic_results
+
+
+IMPORTS = {
+    'package': "import lamarr_energy_tracker",
+    'tracker': "from lamarr_energy_tracker import EnergyTracker; EnergyTracker(output_dir=sys.argv[1])",
+    'custom_statement': "from lamarr_energy_tracker import print_custom_paper_statement; print_custom_paper_statement('CodeCarbon', 'CPU', 1.0)",
+    'ground_truth_client': "from lamarr_energy_tracker import GroundTruthTracker",
+}
+
+
+def bench_import(output_dir, repeats=5):
+    """Median time (in seconds) of running each statement in a fresh interpreter, in addition to the interpreter startup"""
+    def run_python(code):
+        t_start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import sys\n{code}", output_dir], check=True, stdout=subprocess.DEVNULL)
+        return time.perf_counter() - t_start
+    startup = statistics.median(run_python("pass") for _ in range(repeats))
+    return {name: statistics.median(run_python(code) for _ in range(repeats)) - startup for name, code in IMPORTS.items()}
+
+
+def bench_start_stop(output_dir, repeats=5):
+    """Mean latency (in seconds) of creating, starting and stopping a tracker"""
+    from lamarr_energy_tracker import EnergyTracker
+    timings = {'init_s': 0.0, 'start_s': 0.0, 'stop_s': 0.0}
+    for _ in range(repeats):
+        t_start = time.perf_counter()
+        tracker = EnergyTracker(project_name="bench_start_stop", output_dir=output_dir)
+        t_init = time.perf_counter()
+        tracker.start()
+        t_started = time.perf_counter()
+        tracker.stop(print_summary=False)
+        t_stopped = time.perf_counter()
+        timings['init_s'] += (t_init - t_start) / repeats
+        timings['start_s'] += (t_started - t_init) / repeats
+        timings['stop_s'] += (t_stopped - t_started) / repeats
+    return timings
+
+
+def bench_sampler(output_dir, measure_power_secs, duration):
+    """CPU time used by the sampling thread, while the main thread is idle"""
+    from lamarr_energy_tracker import EnergyTracker
+    tracker = EnergyTracker(project_name="bench_sampler", output_dir=output_dir, measure_power_secs=measure_power_secs)
+    tracker.start()
+    cpu_start = time.process_time()
+    time.sleep(duration)
+    cpu_time = time.process_time() - cpu_start
+    tracker.stop(print_summary=False)
+    return {'cpu_s': cpu_time, 'cpu_percent': cpu_time / duration * 100}
+
+
+def bench_stop(output_dir):
+    """Time of stopping with summary (for a cold and a warm summary cache) and the peak memory increase of the process"""
+    from lamarr_energy_tracker import EnergyTracker
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = {}
+    for cache in ['cold', 'warm']:
+        tracker = EnergyTracker(project_name="bench_stop", output_dir=output_dir)
+        tracker.start()
+        t_start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            tracker.stop()
+        timings[f'{cache}_s'] = time.perf_counter() - t_start
+    timings['peak_mb'] = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start) / 1e3 # ru_maxrss is given in KB
+    assert not os.path.exists(os.path.join(output_dir, 'emissions.csv.bak')), "Synthetic results do not match the CodeCarbon format"
+    return timings
+
+
+def bench_load(output_dir):
+    """Time and peak memory increase of loading all results and formatting their summary"""
+    from lamarr_energy_tracker.print_paper_statement import format_summary, load_results
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t_start = time.perf_counter()
+    results = load_results(output_dir, project_name='project1', hostname='host1')
+    t_loaded = time.perf_counter()
+    format_summary(results)
+    t_formatted = time.perf_counter()
+    return {
+        'load_s': t_loaded - t_start,
+        'format_summary_s': t_formatted - t_loaded,
+        'peak_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start) / 1e3
+    }
+
+
+def bench_summary(output_dir, chunksize=100_000):
+    """Time and peak memory increase of aggregating all results for a paper statement, without a cached summary"""
+    from lamarr_energy_tracker.print_paper_statement import load_summary
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t_start = time.perf_counter()
+    load_summary(output_dir, chunksize=chunksize)
+    return {
+        'summary_s': time.perf_counter() - t_start,
+        'peak_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start) / 1e3
+    }
+
+
+def run(sizes=(1_000, 10_000, 100_000, 1_000_000), intervals=(0.1, 0.5, 1.0), sampler_duration=5):
+    """Runs all benchmarks, each in a fresh process and output directory"""
+    results = {'meta': {'python': sys.version.split()[0], 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}}
+    with tempfile.TemporaryDirectory() as output_dir:
+        results['import'] = bench_import(output_dir)
+        results['start_stop'] = in_subprocess(bench_start_stop, output_dir)
+    results['sampler'] = {}
+    for interval in intervals:
+        with tempfile.TemporaryDirectory() as output_dir:
+            results['sampler'][str(interval)] = in_subprocess(bench_sampler, output_dir, interval, sampler_duration)
+    results['stop'], results['load'], results['summary'] = {}, {}, {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as output_dir:
+            in_subprocess(write_synthetic_results, os.path.join(output_dir, 'emissions.csv'), size)
+            results['load'][str(size)] = in_subprocess(bench_load, output_dir)
+            results['summary'][str(size)] = in_subprocess(bench_summary, output_dir)
+            results['stop'][str(size)] = in_subprocess(bench_stop, output_dir)
+    return results
+
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}/'))
+        elif isinstance(value, (int, float)):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def regressions(results, baseline, tolerance=0.2):
+    """All measurements (lower is better) that are more than tolerance worse than in the baseline"""
+    current, previous = flatten(results), flatten(baseline)
+    return {key: (previous[key], value) for key, value in current.items()
+            if key in previous and previous[key] > 0 and value > previous[key] * (1 + tolerance)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the overhead of the EnergyTracker (import time, start/stop latency, sampling CPU time, stop(), load_results and summaries for growing emissions.csv files).")
+    parser.add_argument("--output", type=str, default=None, help="JSON file for storing the results")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON file with previous results, to report regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative slowdown to report as regression")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000], help="Numbers of synthetic result rows")
+    parser.add_argument("--intervals", type=float, nargs="+", default=[0.1, 0.5, 1.0], help="Values of measure_power_secs for the sampler benchmark")
+    parser.add_argument("--sampler_duration", type=float, default=5, help="Seconds of sampling per interval")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.intervals, args.sampler_duration)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as wf:
+            json.dump(results, wf, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as rf:
+            found = regressions(results, json.load(rf), args.tolerance)
+        for key, (previous, current) in found.items():
+            print(f"Regression in {key}: {previous:.4g} -> {current:.4g}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,35 @@
+"""
+Synthetic CodeCarbon results for benchmarking
+"""
+import numpy as np
+import pandas as pd
+
+from lamarr_energy_tracker.results_store import FLOAT_COLUMNS, STRING_COLUMNS
+
+
+def synthetic_results(n_rows, n_projects=50, n_users=20, n_hosts=10, seed=0):
+    """Generates a DataFrame with n_rows CodeCarbon results of randomly chosen projects, users and hosts"""
+    rng = np.random.default_rng(seed)
+    projects = rng.integers(n_projects, size=n_rows)
+    users = rng.integers(n_users, size=n_rows)
+    hosts = rng.integers(n_hosts, size=n_rows)
+    experiment_ids = pd.Series([f'project{p}___user{u}___host{h}' for p, u, h in zip(projects, users, hosts)])
+    results = pd.DataFrame({col: rng.random(n_rows) for col in FLOAT_COLUMNS})
+    results['energy_consumed'] = results['cpu_energy'] + results['gpu_energy'] + results['ram_energy']
+    results['emissions'] = results['energy_consumed'] * 0.38
+    for col in STRING_COLUMNS:
+        results[col] = col
+    results['timestamp'] = pd.date_range('2024-01-01', periods=n_rows, freq='s').strftime('%Y-%m-%dT%H:%M:%S')
+    results['run_id'] = [f'{seed:08x}{idx:024x}' for idx in range(n_rows)]
+    results['experiment_id'] = experiment_ids
+    results['project_name'] = 'codecarbon'
+    results['codecarbon_version'] = '3.2.3'
+    results['cpu_model'] = np.array(['Intel CPU @ 2.0GHz', 'AMD CPU'])[hosts % 2]
+    results['gpu_model'] = np.array(['NVIDIA GPU', None])[hosts % 2]
+    return results[STRING_COLUMNS[:4] + FLOAT_COLUMNS[:11] + STRING_COLUMNS[4:] + FLOAT_COLUMNS[11:]]
+
+
+def write_synthetic_results(path, n_rows, **kwargs):
+    """Writes synthetic results to a CSV file, in the same format as CodeCarbon"""
+    synthetic_results(n_rows, **kwargs).to_csv(path, index=False)
+    return path
@@ -34,6 +34,10 @@ setup(
         "test": [
             "pytest>=7.0.0",
             "pandas>=1.0.0",
+            "pyarrow",
+        ],
+        "parquet": [
+            "pyarrow",
         ],
     },
 )
\ No newline at end of file
@@ -2,16 +2,26 @@
 Lamarr Energy Tracker - A wrapper for CodeCarbon to track energy consumption
 """
 
+import os
+
 __version__ = "0.1.0"
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.expanduser('~'), '.let')
+
+# all names are imported lazily, such that the package and its CLIs only import pandas and codecarbon when needed
+# (print_paper_statement is not listed, as importing the submodule of the same name replaces the package attribute)
+LAZY_IMPORTS = {
+    "EnergyTracker": "tracker",
+    "delete_results": "tracker",
+    "GroundTruthTracker": "ground_truth_tracking",
+    "GroundTruthTrackingServer": "ground_truth_tracking",
+    "load_results": "print_paper_statement",
+    "load_summary": "print_paper_statement",
+    "print_custom_paper_statement": "print_paper_statement",
+    "compare_groundtruth": "validation",
+}
 
 def __getattr__(name):
-    if name == "EnergyTracker":
-        from .tracker import EnergyTracker
-        return EnergyTracker
-    if name == "GroundTruthTracker":
-        from .ground_truth_tracking import GroundTruthTracker
-        return GroundTruthTracker
-    if name == "GroundTruthTrackingServer":
-        from .ground_truth_tracking import GroundTruthTrackingServer
-        return GroundTruthTrackingServer
+    if name in LAZY_IMPORTS:
+        from importlib import import_module
+        return getattr(import_module(f".{LAZY_IMPORTS[name]}", __name__), name)
     raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
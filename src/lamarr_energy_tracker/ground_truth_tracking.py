@@ -1,60 +1,423 @@
 import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import getpass
+from itertools import accumulate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
 import os
 from pathlib import Path
+import random
 import requests
 import socket
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+import uuid
+
+from lamarr_energy_tracker import DEFAULT_OUTPUT_DIR
+from lamarr_energy_tracker.metrics import send_metrics
 
 GT_FMT = "%Y-%m-%dT%H:%M:%S"
 REMOTE_CONFIG_FILE = os.path.join(Path.home(), '.let', 'GT_REMOTE_CONFIG')
 
-def send_tasmota_query(ip, cmd):
-    url = f"http://{ip}/cm?cmnd={cmd}"
-    print(f'[GroundTruthTrackingServer] {url}')
-    try:
-        r = requests.get(url, timeout=5)
-        if cmd == 'Status%208':
-            data = r.json()
+REQUEST_BUDGET = 4.0 # seconds for all device queries of a single start or stop
+
+class DeviceError(Exception):
+    """Failed query to a smart socket, with its kind being timeout, unreachable, invalid_response or circuit_open"""
+
+    def __init__(self, ip, cmd, kind, message):
+        super().__init__(f"[{ip} {cmd}] {kind}: {message}")
+        self.ip = ip
+        self.cmd = cmd
+        self.kind = kind
+        self.message = message
+
+    def to_dict(self):
+        return {'ip': self.ip, 'cmd': self.cmd, 'kind': self.kind, 'message': self.message}
+
+class LatencyHistogram:
+    """Cumulative histogram of query latencies, with fixed bucket bounds"""
+
+    BOUNDS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf')) # seconds
+
+    def __init__(self):
+        self.counts = [0] * len(self.BOUNDS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.BOUNDS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        """Bucket bounds with the number of latencies up to them"""
+        return list(zip(self.BOUNDS, accumulate(self.counts)))
+
+class TasmotaDevice:
+    """
+    Connection to a single Tasmota smart socket, which reuses one keep-alive session for all commands.
+    Failed queries are retried with jittered backoff within their deadline, and consecutive failures open a circuit breaker,
+    such that a dead socket fails fast until the breaker is probed again.
+    """
+
+    ATTEMPT_TIMEOUT = 2.0 # seconds
+    RETRIES = 2
+    BACKOFF = 0.1 # seconds before the first retry, doubled for each further retry
+    FAILURE_THRESHOLD = 3 # consecutive failed queries that open the breaker
+    RESET_TIMEOUT = 30.0 # seconds until an open breaker lets a single probe through
+
+    def __init__(self, ip):
+        self.ip = ip
+        self.session = requests.Session()
+        self.energy_resolution_set = False
+        self.latency = LatencyHistogram()
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def circuit_open(self):
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.RESET_TIMEOUT
+
+    def query(self, cmd, deadline=None):
+        """Response JSON of the command, raising a DeviceError if it failed within the deadline (given as time.monotonic() value)"""
+        deadline = time.monotonic() + REQUEST_BUDGET if deadline is None else deadline
+        with self.lock:
+            if self.circuit_open:
+                raise DeviceError(self.ip, cmd, 'circuit_open', f"{self.failures} consecutive failures, retrying after {self.RESET_TIMEOUT:.0f} seconds")
+            if self.opened_at is not None:
+                # half-open, this query probes the socket for the next RESET_TIMEOUT seconds
+                self.opened_at = time.monotonic()
+        try:
+            data = self.attempt(cmd, deadline)
+        except DeviceError:
+            with self.lock:
+                self.failures += 1
+                if self.failures >= self.FAILURE_THRESHOLD:
+                    self.opened_at = time.monotonic()
+            raise
+        with self.lock:
+            self.failures, self.opened_at = 0, None
+        return data
+
+    def attempt(self, cmd, deadline):
+        url = f"http://{self.ip}/cm?cmnd={cmd}"
+        for retry in range(self.RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeviceError(self.ip, cmd, 'timeout', "Deadline exceeded")
+            t_start = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=min(self.ATTEMPT_TIMEOUT, remaining))
+                response.raise_for_status()
+                return response.json()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # only network errors are transient, so only they are retried
+                error = DeviceError(self.ip, cmd, 'timeout' if isinstance(e, requests.Timeout) else 'unreachable', str(e))
+            except (requests.RequestException, ValueError) as e: # ValueError for invalid JSON
+                raise DeviceError(self.ip, cmd, 'invalid_response', str(e))
+            finally:
+                self.latency.observe(time.perf_counter() - t_start)
+            backoff = self.BACKOFF * 2 ** retry * random.uniform(0.5, 1.5)
+            if retry == self.RETRIES or time.monotonic() + backoff >= deadline:
+                raise error
+            time.sleep(backoff)
+
+    def set_energy_resolution(self, deadline=None):
+        # the resolution is persisted on the device, so it only needs to be set once
+        if not self.energy_resolution_set:
+            send_tasmota_query(self.ip, 'EnergyRes%205', deadline=deadline) # five decimals for energy report
+            self.energy_resolution_set = True
+
+DEVICES = {}
+DEVICES_LOCK = threading.Lock()
+
+def get_device(ip):
+    with DEVICES_LOCK:
+        if ip not in DEVICES:
+            DEVICES[ip] = TasmotaDevice(ip)
+        return DEVICES[ip]
+
+def send_tasmota_query(ip, cmd, verbose=True, deadline=None):
+    """Queries the smart socket, raising a DeviceError if this fails"""
+    if verbose:
+        print(f'[GroundTruthTrackingServer] http://{ip}/cm?cmnd={cmd}')
+    data = get_device(ip).query(cmd, deadline)
+    if cmd == 'Status%208':
+        try:
             results = {
                 'energy_consumed': data["StatusSNS"]["ENERGY"]["Total"], # kWh
                 'start_time': data["StatusSNS"]["ENERGY"]["TotalStartTime"],
-                'timestamp': data["StatusSNS"]["Time"]
+                'timestamp': data["StatusSNS"]["Time"],
+                'power': data["StatusSNS"]["ENERGY"].get("Power") # W
             }
             results['duration'] = (datetime.strptime(results['timestamp'], GT_FMT) - datetime.strptime(results['start_time'], GT_FMT)).total_seconds()
-            return results
-    except Exception as e:
-        print(f"[{ip} {cmd}] Error reading power: {e}")
-        return None
+        except (KeyError, TypeError, ValueError) as e:
+            raise DeviceError(ip, cmd, 'invalid_response', f"Unexpected status {e!r}")
+        return results
+    return data
     
-def tasmota_start(ip):
-    send_tasmota_query(ip, 'EnergyRes%205') # five decimals for energy report
-    results = send_tasmota_query(ip, 'Status%208')
-    # reset all counts
-    send_tasmota_query(ip, 'EnergyYesterday%200')
-    send_tasmota_query(ip, 'EnergyToday%200')
-    send_tasmota_query(ip, 'EnergyTotal%200')
-    # update start time
-    results2 = send_tasmota_query(ip, 'Status%208')
-    results['timestamp'] = results2['timestamp']
+def tasmota_read(ip, budget=REQUEST_BUDGET, deadline=None):
+    """Single reading of the cumulative energy counter, the counter start time and the current time of the smart socket"""
+    deadline = time.monotonic() + budget if deadline is None else deadline
+    get_device(ip).set_energy_resolution(deadline)
+    return send_tasmota_query(ip, 'Status%208', deadline=deadline)
+
+def energy_delta(start, end):
+    """Energy consumed between two readings of the same smart socket"""
+    if end['start_time'] != start['start_time'] or end['energy_consumed'] < start['energy_consumed']:
+        # the counter was reset in between (e.g., manually or by older servers), so only the energy since then is known
+        results = dict(end, counter_reset=True)
+    else:
+        results = dict(end, start_time=start['timestamp'], energy_consumed=round(end['energy_consumed'] - start['energy_consumed'], 5))
+    results['duration'] = (datetime.strptime(results['timestamp'], GT_FMT) - datetime.strptime(results['start_time'], GT_FMT)).total_seconds()
     return results
 
-def tasmota_stop(ip):
-    send_tasmota_query(ip, 'EnergyRes%205') # five decimals for energy report
-    return send_tasmota_query(ip, 'Status%208')
+class PowerSeries:
+    """Fixed-size ring buffer of timestamped power samples, backed by preallocated arrays"""
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("[PowerSeries] The capacity has to be at least one sample")
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.power = array('d', bytes(8 * capacity))
+        self.size = 0
+        self.head = 0 # next position to write
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, power):
+        with self.lock:
+            self.timestamps[self.head] = timestamp
+            self.power[self.head] = power
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def since(self, timestamp=0):
+        """Chronologically ordered timestamps and power of all samples taken after the given timestamp"""
+        with self.lock:
+            if self.size < self.capacity:
+                timestamps, power = self.timestamps[:self.size], self.power[:self.size]
+            else:
+                timestamps = self.timestamps[self.head:] + self.timestamps[:self.head]
+                power = self.power[self.head:] + self.power[:self.head]
+        first = bisect_right(timestamps, timestamp)
+        return timestamps[first:], power[first:]
+
+    def encode(self, timestamp=0):
+        """Compact JSON encoding, with timestamps as millisecond offsets to the first sample"""
+        timestamps, power = self.since(timestamp)
+        t0 = timestamps[0] if len(timestamps) > 0 else None
+        return {'t0': t0, 'dt': [round((t - t0) * 1000) for t in timestamps], 'power': [round(p, 2) for p in power]}
+
+def sample_power(server, hostname, ip, interval):
+    """Periodically samples the current power of a smart socket, as long as it is not busy with other requests"""
+    while not server.sampling_stopped.wait(interval):
+        if server.socket_locks[ip].acquire(blocking=False):
+            t_start = time.perf_counter()
+            results = None
+            try:
+                results = send_tasmota_query(ip, 'Status%208', verbose=False)
+            except DeviceError:
+                pass # counted as error of the host, an open circuit breaker makes further samples fail fast
+            finally:
+                server.socket_locks[ip].release()
+            server.record_query(hostname, results, time.perf_counter() - t_start)
+            if results is not None and results['power'] is not None:
+                server.series[hostname].append(time.time(), results['power'])
+
+def parse_config(config):
+    """Maps each host to its smart socket IP and each group to its hosts, with config entries being either an IP or {"ip": IP, "groups": [GROUPS]}"""
+    ips, groups = {}, {}
+    for hostname, entry in config.items():
+        if isinstance(entry, str):
+            entry = {'ip': entry}
+        ips[hostname] = entry['ip']
+        for group in entry.get('groups', []):
+            groups.setdefault(group, []).append(hostname)
+    return ips, groups
+
+class SessionError(Exception):
+    """Stop of a tracking session that is unknown to the server, or that does not include the host"""
+
+    def __init__(self, hostname, session_id):
+        super().__init__(f"Unknown session {session_id} of host {hostname}" if session_id is not None else f"No session of host {hostname}")
+        self.hostname = hostname
+        self.session_id = session_id
+
+    def to_dict(self):
+        return {'host': self.hostname, 'session_id': self.session_id, 'kind': 'unknown_session', 'message': str(self)}
+
+class GroundTruthTrackingHTTPServer(ThreadingHTTPServer):
+    """Handles every request in its own thread, while queries to the same smart socket are serialized"""
+
+    daemon_threads = True
+    MAX_SESSIONS = 10000
+
+    def __init__(self, server_address, config, sample_interval=0, series_capacity=86400):
+        self.config, self.groups = parse_config(config)
+        self.socket_locks = {ip: threading.Lock() for ip in set(self.config.values())}
+        self.series = {hostname: PowerSeries(series_capacity) for hostname in self.config}
+        # the address is only bound once the configuration is valid
+        super().__init__(server_address, GroundTruthTrackingRequestHandler)
+        # the last read values and query statistics per host, which are served at /metrics without querying the smart sockets
+        self.metrics = {hostname: {'energy': None, 'power': None, 'timestamp': None, 'seconds': 0.0, 'queries': 0, 'errors': 0} for hostname in self.config}
+        self.metrics_lock = threading.Lock()
+        # snapshots of the energy counters at the start of each session, in the order of starting
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(len(self.config), 1))
+        self.sampling_stopped = threading.Event()
+        self.samplers = []
+        if sample_interval > 0:
+            for hostname, ip in self.config.items():
+                sampler = threading.Thread(target=sample_power, args=(self, hostname, ip, sample_interval), daemon=True)
+                sampler.start()
+                self.samplers.append(sampler)
+
+    def read(self, hostname, deadline=None):
+        """Reading of the smart socket of the host, within the deadline (as time.monotonic() value) that includes waiting for other requests"""
+        ip = self.config[hostname]
+        deadline = time.monotonic() + REQUEST_BUDGET if deadline is None else deadline
+        # other hosts are handled in parallel, but each smart socket only serves one request at a time
+        if not self.socket_locks[ip].acquire(timeout=max(deadline - time.monotonic(), 0)):
+            raise DeviceError(ip, 'Status%208', 'timeout', "Deadline exceeded while waiting for other requests to the smart socket")
+        try:
+            t_start = time.perf_counter()
+            reading = None
+            try:
+                reading = tasmota_read(ip, deadline=deadline)
+            finally:
+                self.record_query(hostname, reading, time.perf_counter() - t_start)
+            return reading
+        finally:
+            self.socket_locks[ip].release()
+
+    def run_command(self, hostname, cmd, session_id=None):
+        """Starts a new session from a single reading, or returns the energy consumed since the start of the given (or most recent) session of the host"""
+        # the deadline starts when the request arrives, such that the client receives a response before giving up
+        reading = self.read(hostname, time.monotonic() + REQUEST_BUDGET)
+        if cmd == "start":
+            return dict(reading, session_id=self.start_session({hostname: reading}))
+        return self.stop_session(hostname, reading, session_id)
+
+    def start_session(self, readings):
+        """Keeps the readings of all hosts as snapshot of their energy counters, instead of resetting the counters"""
+        session_id = uuid.uuid4().hex
+        with self.sessions_lock:
+            self.sessions[session_id] = readings
+            if len(self.sessions) > self.MAX_SESSIONS:
+                # sessions that are never stopped are dropped, oldest first
+                del self.sessions[next(iter(self.sessions))]
+        return session_id
+
+    def stop_session(self, hostname, reading, session_id=None):
+        with self.sessions_lock:
+            if session_id is None:
+                session_id = next((sid for sid in reversed(self.sessions) if hostname in self.sessions[sid]), None)
+                if session_id is None:
+                    # the counters are never reset, so without any session (e.g., after a restart) the energy of the run is unknown
+                    raise SessionError(hostname, None)
+            elif hostname not in self.sessions.get(session_id, {}):
+                raise SessionError(hostname, session_id)
+            start = self.sessions[session_id].pop(hostname)
+            if not self.sessions[session_id]:
+                del self.sessions[session_id]
+        return dict(energy_delta(start, reading), session_id=session_id)
+
+    def record_query(self, hostname, results, seconds):
+        with self.metrics_lock:
+            metrics = self.metrics[hostname]
+            metrics['seconds'] += seconds
+            metrics['queries'] += 1
+            if results is None:
+                metrics['errors'] += 1
+                return
+            metrics['energy'], metrics['timestamp'] = results['energy_consumed'], time.time()
+            if results.get('power') is not None:
+                metrics['power'] = results['power']
+
+    def collect_metrics(self):
+        """Metric families of the last read values per host"""
+        with self.metrics_lock:
+            metrics = {hostname: dict(values) for hostname, values in self.metrics.items()}
+        def samples(key):
+            return [({'host': hostname}, values[key]) for hostname, values in metrics.items() if values[key] is not None]
+        return [
+            ('let_gt_energy_consumed_kwh', 'gauge', 'Cumulative energy counter of the smart socket, as last read', samples('energy')),
+            ('let_gt_power_watts', 'gauge', 'Power as last read from the smart socket', samples('power')),
+            ('let_gt_last_read_timestamp_seconds', 'gauge', 'Unix time of the last successful read from the smart socket', samples('timestamp')),
+            ('let_gt_query_duration_seconds', 'summary', 'Duration of queries to the smart socket',
+             [({'host': hostname}, {'_sum': values['seconds'], '_count': values['queries']}) for hostname, values in metrics.items()]),
+            ('let_gt_query_errors_total', 'counter', 'Failed queries to the smart socket', samples('errors')),
+        ] + self.collect_device_metrics()
+
+    def collect_device_metrics(self):
+        """Metric families of the latency histograms and circuit breakers of all smart sockets"""
+        devices = {hostname: get_device(ip) for hostname, ip in self.config.items()}
+        latency, breakers = [], []
+        for hostname, device in devices.items():
+            for bound, count in device.latency.cumulative():
+                latency.append(({'host': hostname, 'le': '+Inf' if bound == float('inf') else repr(bound)}, {'_bucket': count}))
+            latency.append(({'host': hostname}, {'_sum': device.latency.sum, '_count': device.latency.count}))
+            breakers.append(({'host': hostname}, int(device.circuit_open)))
+        return [
+            ('let_gt_device_latency_seconds', 'histogram', 'Latency of single requests to the smart socket, including failed and retried ones', latency),
+            ('let_gt_circuit_open', 'gauge', 'Whether the circuit breaker of the smart socket is open, such that queries fail fast', breakers),
+        ]
+
+    def run_bulk_command(self, hostnames, cmd, session_id=None):
+        """Reads all given hosts concurrently and starts (or stops) a single session for them, collecting the results and errors per host"""
+        deadline = time.monotonic() + REQUEST_BUDGET
+        futures = {hostname: self.executor.submit(self.read, hostname, deadline) for hostname in hostnames}
+        response = {'results': {}, 'errors': {}}
+        readings = {}
+        for hostname, future in futures.items():
+            try:
+                readings[hostname] = future.result()
+            except DeviceError as e:
+                response['errors'][hostname] = e.to_dict()
+            except Exception as e:
+                response['errors'][hostname] = {'ip': self.config[hostname], 'cmd': cmd, 'kind': 'error', 'message': f"{type(e).__name__}: {e}"}
+        if cmd == "start":
+            response['session_id'] = self.start_session(readings) if readings else None
+            response['results'] = {hostname: dict(reading, session_id=response['session_id']) for hostname, reading in readings.items()}
+            return response
+        for hostname, reading in readings.items():
+            try:
+                response['results'][hostname] = self.stop_session(hostname, reading, session_id)
+            except SessionError as e:
+                response['errors'][hostname] = e.to_dict()
+        return response
+
+    def server_close(self):
+        self.sampling_stopped.set()
+        self.executor.shutdown(wait=False)
+        super().server_close()
 
 class GroundTruthTrackingServer:
 
-    def __init__(self, config_file, host='0.0.0.0', port=8000):
+    def __init__(self, config_file, host='0.0.0.0', port=8000, block=True, sample_interval=0, series_capacity=86400):
         with open(config_file, 'r') as cf:
             self.config = json.load(cf)
         self.host = host
-        self.port = port
-        self.server = HTTPServer((self.host, self.port), GroundTruthTrackingRequestHandler)
-        self.server.config = self.config
+        self.server = GroundTruthTrackingHTTPServer((host, port), self.config, sample_interval, series_capacity)
+        self.port = self.server.server_address[1]
         print(f"Serving on {self.host}:{self.port}")
-        self.server.serve_forever()
+        if block:
+            self.server.serve_forever()
+        else:
+            self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+            self.thread.start()
+
+    def shutdown(self):
+        """Stop serving, if the server was started without blocking"""
+        self.server.shutdown()
+        self.server.server_close()
 
 class GroundTruthTrackingRequestHandler(BaseHTTPRequestHandler):
 
@@ -63,9 +426,15 @@ class GroundTruthTrackingRequestHandler(BaseHTTPRequestHandler):
         # Example calls:
         # /list
         # /ws28/start
-        # /dgx1/stop
+        # /dgx1/stop?session=SESSION_ID
+        # /dgx1/series?since=1718000000.0
+        # /start_all
+        # /group/gpu/stop
+        # /metrics
 
-        path = self.path[1:]
+        url = urlparse(self.path)
+        path = url.path[1:]
+        session_id = parse_qs(url.query).get('session', [None])[0]
 
         if path == "list":
             self.send_response(200)
@@ -76,6 +445,29 @@ class GroundTruthTrackingRequestHandler(BaseHTTPRequestHandler):
             )
             return
 
+        if path == "metrics":
+            send_metrics(self, self.server.collect_metrics())
+            return
+
+        if path in ["start_all", "stop_all"]:
+            self.send_json(self.server.run_bulk_command(list(self.server.config), path.split('_')[0], session_id))
+            return
+
+        if path.startswith("group/"):
+            try:
+                _, group, cmd = path.split('/')
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            if group not in self.server.groups or cmd not in ["start", "stop"]:
+                self.send_response(404)
+                self.end_headers()
+                self.wfile.write(b"Unknown group")
+                return
+            self.send_json(self.server.run_bulk_command(self.server.groups[group], cmd, session_id))
+            return
+
         try:
             hostname, cmd = path.split('/')
         except ValueError:
@@ -89,20 +481,33 @@ class GroundTruthTrackingRequestHandler(BaseHTTPRequestHandler):
             self.wfile.write(b"Unknown hostname")
             return
 
-        ip = self.server.config[hostname]
-
-        if cmd == "start":
-            response = tasmota_start(ip)
-
-        elif cmd == "stop":
-            response = tasmota_stop(ip)
+        if cmd == "series":
+            try:
+                since = float(parse_qs(url.query).get('since', [0])[0])
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            self.send_json(self.server.series[hostname].encode(since))
+            return
 
-        else:
+        if cmd not in ["start", "stop"]:
             self.send_response(404)
             self.end_headers()
             return
 
-        self.send_response(200)
+        try:
+            results = self.server.run_command(hostname, cmd, session_id)
+        except DeviceError as e:
+            self.send_json({'error': e.to_dict()}, status=503 if e.kind == 'circuit_open' else 502)
+            return
+        except SessionError as e:
+            self.send_json({'error': e.to_dict()}, status=404)
+            return
+        self.send_json(results)
+
+    def send_json(self, response, status=200):
+        self.send_response(status)
         self.send_header("Content-Type", "application/json")
         self.end_headers()
         self.wfile.write(json.dumps(response).encode())
@@ -111,14 +516,32 @@ class GroundTruthTrackingRequestHandler(BaseHTTPRequestHandler):
         return
     
 
+def parse_times(results):
+    results['start_time'] = datetime.strptime(results['start_time'], GT_FMT)
+    results['timestamp'] = datetime.strptime(results['timestamp'], GT_FMT)
+    return results
+
 class GroundTruthTracker:
 
+    # all clients share one keep-alive session and the host lists of recently contacted servers
+    session = requests.Session()
+    # non-blocking commands are sent one after another by a single background thread, so they keep their order
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="GroundTruthTracker")
+    available_hosts = {}
+    HOSTS_TTL = 60 # seconds
+
     @classmethod
-    def all_available(cls, server_host, server_port=8000):
+    def all_available(cls, server_host, server_port=8000, max_age=None):
+        max_age = cls.HOSTS_TTL if max_age is None else max_age
+        cached = cls.available_hosts.get((server_host, str(server_port)))
+        if cached is not None and time.monotonic() - cached[0] < max_age:
+            return cached[1]
         try:
-            response = requests.get(f"http://{server_host}:{server_port}/list", timeout=5)
+            response = cls.session.get(f"http://{server_host}:{server_port}/list", timeout=5)
             response.raise_for_status()
-            return response.json()
+            hosts = response.json()
+            cls.available_hosts[(server_host, str(server_port))] = (time.monotonic(), hosts)
+            return hosts
         except Exception as e:
             print(f"[GroundTruthTracker] Could not connect to server: {e}")
             return False
@@ -129,23 +552,68 @@ class GroundTruthTracker:
         return socket.gethostname() in available_hosts
 
     @classmethod
-    def send_command(cls, server_host, cmd, server_port=8000):
-        assert GroundTruthTracker.is_available(server_host, server_port), f"[GroundTruthTracker] The host {socket.gethostname()} is not available for tracking, please check A1T server configuration!"
+    def send_command(cls, server_host, cmd, server_port=8000, session_id=None):
+        # no availability check before each command, hosts unknown to the server are reported by a 404
         assert cmd in ['start', 'stop']
         url = f"http://{server_host}:{server_port}/{socket.gethostname()}/{cmd}"
 
         try:
-            response = requests.get(url, timeout=5)
+            # the server answers within its deadline for all smart socket queries
+            response = cls.session.get(url, params={'session': session_id} if session_id else None, timeout=REQUEST_BUDGET + 1)
+            if response.status_code == 404 and response.headers.get('Content-Type') == 'application/json':
+                session = f"The tracking session {session_id}" if session_id else f"Any tracking session of {socket.gethostname()}"
+                raise RuntimeError(f"[GroundTruthTracker] {session} is unknown to the A1T server, it was probably restarted!")
+            if response.status_code == 404:
+                cls.available_hosts.pop((server_host, str(server_port)), None)
+                raise RuntimeError(f"[GroundTruthTracker] The host {socket.gethostname()} is not available for tracking, please check A1T server configuration!")
+            if response.status_code in [502, 503]:
+                error = response.json()['error']
+                raise RuntimeError(f"[GroundTruthTracker] The smart socket of {socket.gethostname()} failed ({error['kind']}): {error['message']}")
+            response.raise_for_status()
+            return parse_times(response.json())
+        except Exception as e:
+            raise RuntimeError(f"Command '{cmd}' failed: {e}")
+
+    @classmethod
+    def send_bulk_command(cls, server_host, cmd, group=None, server_port=8000, session_id=None):
+        """Sends the command to all hosts (or a group of hosts) at once, returning their results and errors"""
+        assert cmd in ['start', 'stop']
+        path = f"{cmd}_all" if group is None else f"group/{group}/{cmd}"
+        url = f"http://{server_host}:{server_port}/{path}"
+
+        try:
+            # the server queries all smart sockets concurrently, so this takes about as long as a single command
+            response = cls.session.get(url, params={'session': session_id} if session_id else None, timeout=30)
+            if response.status_code == 404:
+                raise RuntimeError(f"[GroundTruthTracker] The group {group} is unknown to the A1T server, please check configuration!")
             response.raise_for_status()
             results = response.json()
-            results['start_time'] = datetime.strptime(results['start_time'], GT_FMT)
-            results['timestamp'] = datetime.strptime(results['timestamp'], GT_FMT)
+            for host_results in results['results'].values():
+                parse_times(host_results)
             return results
         except Exception as e:
             raise RuntimeError(f"Command '{cmd}' failed: {e}")
 
-    def __init__(self, verbose=True):
+    def __init__(self, verbose=True, project_name="default", output_dir=None, backend="csv", store_results=True):
+        """
+        Initialize the ground-truth tracker
+
+        Args:
+            verbose (bool, optional): Print the results of each command
+            project_name (str, optional): Name of the project being tracked, for storing the results next to the ones of the EnergyTracker
+            output_dir (str, optional): Directory of the results store
+            backend (str, optional): Storage backend for the results, either "csv" (default), "parquet" or "sqlite"
+            store_results (bool, optional): Append the results of every stop to the groundtruth table of the results store
+        """
         self.verbose = verbose
+        self.project_name = project_name
+        self.output_dir = DEFAULT_OUTPUT_DIR if output_dir is None else output_dir
+        self.backend = backend
+        self.store_results = store_results
+        self.user = getpass.getuser()
+        # the server keeps a snapshot of the energy counters for every started session
+        self.session_id = None
+        self.bulk_session_id = None
 
         try:
             self.server_host, self.server_port = os.environ['LET_GT_HOST'], os.environ['LET_GT_PORT']
@@ -166,19 +634,66 @@ class GroundTruthTracker:
         except Exception:
             raise RuntimeError(f"[GroundTruthTracker] Could not connect to server at {self.server_host}:{self.server_port}, please make sure that it was correctly started!")
 
-    def start(self):
-        """Start tracking for this host"""
+    def start(self, block=True):
+        """Start tracking for this host, or return a Future of the results if not blocking"""
+        if not block:
+            return GroundTruthTracker.executor.submit(self.start)
         results = GroundTruthTracker.send_command(self.server_host, "start", self.server_port)
+        self.session_id = results.get('session_id')
         if self.verbose:
-            print(f"[GroundTruthTracker] Restarted tracking on {datetime.strftime(results['timestamp'], GT_FMT)}, after {results['duration']/3600:7.2f} hours and {results['energy_consumed']:7.2f} kWh of tracking!")
+            print(f"[GroundTruthTracker] Started tracking on {datetime.strftime(results['timestamp'], GT_FMT)}, with the smart socket standing at {results['energy_consumed']:7.2f} kWh after {results['duration']/3600:7.2f} hours!")
         return results
 
-    def stop(self):
-        """Stop tracking for this host"""
-        results = GroundTruthTracker.send_command(self.server_host, "stop", self.server_port)
+    def stop(self, block=True):
+        """Stop tracking for this host, or return a Future of the results if not blocking"""
+        if not block:
+            return GroundTruthTracker.executor.submit(self.stop)
+        results = GroundTruthTracker.send_command(self.server_host, "stop", self.server_port, self.session_id)
+        self.session_id = None
         if self.verbose:
-            print(f"[GroundTruthTracker] Tracking after {results['duration']/60:7.2f} minutes standing at {results['energy_consumed']:12.5f} kWh!")
+            print(f"[GroundTruthTracker] Tracked {results['energy_consumed']:12.5f} kWh in {results['duration']/60:7.2f} minutes!")
         results['tracking_mode'] = 'groundtruth'
+        if self.store_results:
+            self.store({self.hostname: results})
+        return results
+
+    def store(self, results):
+        """Appends the results of each host to the groundtruth table of the results store"""
+        from lamarr_energy_tracker.results_store import get_store
+        rows = [{
+            'timestamp': datetime.strftime(host_results['timestamp'], GT_FMT),
+            'start_time': datetime.strftime(host_results['start_time'], GT_FMT),
+            'run_id': str(uuid.uuid4()),
+            'experiment_id': f"{self.project_name}___{self.user}___{hostname}",
+            'duration': host_results['duration'],
+            'energy_consumed': host_results['energy_consumed'],
+            'tracking_mode': 'groundtruth'
+        } for hostname, host_results in results.items()]
+        os.makedirs(self.output_dir, exist_ok=True)
+        get_store(self.output_dir, self.backend, table='groundtruth').append(rows)
+
+    def start_all(self, group=None, block=True):
+        """Start tracking for all hosts of the server, or only the hosts of the given group"""
+        if not block:
+            return GroundTruthTracker.executor.submit(self.start_all, group)
+        results = GroundTruthTracker.send_bulk_command(self.server_host, "start", group, self.server_port)
+        self.bulk_session_id = results.get('session_id')
+        if self.verbose:
+            print(f"[GroundTruthTracker] Restarted tracking for {len(results['results'])} hosts, {len(results['errors'])} failed!")
+        return results
+
+    def stop_all(self, group=None, block=True):
+        """Stop tracking for all hosts of the server, or only the hosts of the given group"""
+        if not block:
+            return GroundTruthTracker.executor.submit(self.stop_all, group)
+        results = GroundTruthTracker.send_bulk_command(self.server_host, "stop", group, self.server_port, self.bulk_session_id)
+        self.bulk_session_id = None
+        if self.verbose:
+            print(f"[GroundTruthTracker] Stopped tracking for {len(results['results'])} hosts, {len(results['errors'])} failed!")
+        for host_results in results['results'].values():
+            host_results['tracking_mode'] = 'groundtruth'
+        if self.store_results and results['results']:
+            self.store(results['results'])
         return results
     
 
@@ -192,10 +707,12 @@ if __name__ == "__main__":
     parser.add_argument("--config", default=None, help="JSON configuration file, mapping hostnames to trackable A1T Smart Socket IPs")
     parser.add_argument("--host", default='0.0.0.0', help="Host for reaching the REST API")
     parser.add_argument("--port", default=8000, type=int, help="Port for reaching the REST API")
+    parser.add_argument("--sample_interval", default=0, type=float, help="Interval (in seconds) for sampling the power of all smart sockets in the background, disabled if 0")
+    parser.add_argument("--series_capacity", default=86400, type=int, help="Number of power samples kept per host")
     args = parser.parse_args()
 
     if args.config:
-        server = GroundTruthTrackingServer(args.config, args.host, args.port)
+        server = GroundTruthTrackingServer(args.config, args.host, args.port, sample_interval=args.sample_interval, series_capacity=args.series_capacity)
 
     else:
         os.makedirs(os.path.dirname(REMOTE_CONFIG_FILE), exist_ok=True)
@@ -0,0 +1,73 @@
+"""
+Text exposition of live metrics (in the Prometheus format), served from cached values
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(labels):
+    escaped = {key: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for key, value in labels.items()}
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped.items()) + '}' if labels else ''
+
+
+def format_metrics(families):
+    """Exposition text of the given metric families, each given as (name, type, help, [(labels, value), ...])"""
+    lines = []
+    for name, kind, description, samples in families:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            # summaries are given as {'_sum': SECONDS, '_count': COUNT}
+            if isinstance(value, dict):
+                lines.extend(f"{name}{suffix}{format_labels(labels)} {float(val)!r}" for suffix, val in value.items())
+            else:
+                lines.append(f"{name}{format_labels(labels)} {float(value)!r}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        send_metrics(self, self.server.collect())
+
+    def log_message(self, *args):
+        return
+
+
+def send_metrics(handler, families):
+    body = format_metrics(families).encode()
+    handler.send_response(200)
+    handler.send_header("Content-Type", CONTENT_TYPE)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class MetricsServer:
+    """Serves the metric families returned by collect at /metrics, in a background thread"""
+
+    def __init__(self, collect, host='127.0.0.1', port=0):
+        """
+        Start serving
+
+        Args:
+            collect (callable): Returns the metric families to serve, should only read cached values
+            host (str, optional): Address to bind, only reachable from this machine by default
+            port (int, optional): Port to bind, 0 chooses a free port
+        """
+        self.server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self.server.daemon_threads = True
+        self.server.collect = collect
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,81 @@
+"""
+Recording of the periodic power measurements of CodeCarbon into bounded, memory-mapped trace files
+"""
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b'LETTRACE'
+HEADER = struct.Struct('<8sQQ8x') # magic, capacity, number of appended samples, padding to the record size
+RECORD = struct.Struct('<dddd') # timestamp, cpu_power, gpu_power, ram_power
+FIELDS = ['timestamp', 'cpu_power', 'gpu_power', 'ram_power']
+
+
+class PowerTrace:
+    """Fixed-size ring buffer of timestamped power samples (in W), backed by a preallocated memory-mapped file"""
+
+    def __init__(self, path, capacity=86400):
+        """
+        Open the trace file, which is created with room for capacity samples unless it already exists
+
+        Args:
+            path (str): Path to the trace file
+            capacity (int, optional): Number of samples that are kept, older samples are overwritten once the trace is full
+        """
+        if not os.path.exists(path):
+            if capacity < 1:
+                raise ValueError("[PowerTrace] The capacity has to be at least one sample")
+            with open(path, 'wb') as wf:
+                wf.truncate(HEADER.size + capacity * RECORD.size)
+                wf.write(HEADER.pack(MAGIC, capacity, 0))
+        if os.path.getsize(path) < HEADER.size:
+            raise ValueError(f"[PowerTrace] {path} is not a valid power trace file")
+        self.path = path
+        self.file = open(path, 'r+b')
+        self.buffer = mmap.mmap(self.file.fileno(), 0)
+        magic, self.capacity, self.count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or len(self.buffer) != HEADER.size + self.capacity * RECORD.size:
+            self.close()
+            raise ValueError(f"[PowerTrace] {path} is not a valid power trace file")
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, cpu_power, gpu_power, ram_power):
+        with self.lock:
+            RECORD.pack_into(self.buffer, HEADER.size + (self.count % self.capacity) * RECORD.size, timestamp, cpu_power, gpu_power, ram_power)
+            self.count += 1
+            # the count is only updated after writing the sample, such that concurrent readers never see incomplete samples
+            HEADER.pack_into(self.buffer, 0, MAGIC, self.capacity, self.count)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+
+def load_power_trace(path):
+    """Chronologically ordered samples of a trace file, as NumPy structured array with the fields timestamp, cpu_power, gpu_power and ram_power"""
+    import numpy as np
+    with open(path, 'rb') as rf:
+        header = rf.read(HEADER.size)
+        if len(header) < HEADER.size or HEADER.unpack(header)[0] != MAGIC:
+            raise ValueError(f"[PowerTrace] {path} is not a valid power trace file")
+        _, capacity, count = HEADER.unpack(header)
+        samples = np.fromfile(rf, dtype=np.dtype([(field, '<f8') for field in FIELDS]), count=min(count, capacity))
+    # once the trace is full, the oldest sample is the one that is overwritten next
+    return np.roll(samples, -(count % capacity)) if count > capacity else samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prints the samples of a power trace file recorded via EnergyTracker(trace=True).")
+    parser.add_argument("path", type=str, help="Path to the trace file")
+    args = parser.parse_args()
+
+    samples = load_power_trace(args.path)
+    print(f"{'time':>19} {'cpu_power':>10} {'gpu_power':>10} {'ram_power':>10}")
+    for sample in samples:
+        print(f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(sample['timestamp']))} {sample['cpu_power']:10.2f} {sample['gpu_power']:10.2f} {sample['ram_power']:10.2f}")
@@ -1,28 +1,77 @@
 import argparse
 import os
-from pathlib import Path
 import random
-import pandas as pd
-
-def load_results(output_dir = os.path.join(Path.home(), '.let'), project_name = None, user = None, hostname = None):
-    results = pd.read_csv(os.path.join(output_dir, 'emissions.csv'))
-    # map project_name, user and hostname to individual columns
-    for idx, field in enumerate(['project_name', 'user', 'hostname']):
-        results[field] = results['experiment_id'].apply(lambda x: x.split('___')[idx])
-    if project_name is not None:
-        results = results[results['project_name'] == project_name]
-    if user is not None:
-        results = results[results['user'] == user]
-    if hostname is not None:
-        results = results[results['hostname'] == hostname]
-    return results
-
-def print_paper_statement(output_dir, project_name=None, user=None, hostname=None):
+
+from lamarr_energy_tracker import DEFAULT_OUTPUT_DIR
+
+# pandas and the results stores are only imported when loading results, such that custom statements are printed instantly
+def load_results(output_dir = DEFAULT_OUTPUT_DIR, project_name = None, user = None, hostname = None, backend = 'csv', columns = None, table = 'emissions'):
+    """Loads the results of an output directory, or merges the results of several ones given as list or glob pattern (e.g., collected from many hosts)"""
+    from lamarr_energy_tracker.results_store import get_store, is_merged, read_merged
+    if is_merged(output_dir):
+        return read_merged(output_dir, backend, columns, project_name, user, hostname, table)
+    return get_store(output_dir, backend, table=table).read(columns, project_name, user, hostname)
+
+def load_summary(output_dir = DEFAULT_OUTPUT_DIR, project_name = None, user = None, hostname = None, backend = 'csv', chunksize = 100_000):
+    """Loads the energy and emissions summed up per project, user, host, methodology and hardware, streaming through the results in chunks"""
+    from lamarr_energy_tracker.results_store import SUMMARY_KEYS, SUMMARY_VALUES, aggregate_results, get_store, is_merged, read_merged
+    if is_merged(output_dir):
+        # results of several directories may overlap, so they are deduplicated before aggregating
+        return aggregate_results(read_merged(output_dir, backend, SUMMARY_KEYS + SUMMARY_VALUES, project_name, user, hostname))
+    return get_store(output_dir, backend).summary(project_name, user, hostname, chunksize)
+
+def print_paper_statement(output_dir=DEFAULT_OUTPUT_DIR, project_name=None, user=None, hostname=None, backend='csv', chunksize=100_000):
     """Prints a summary of all stored results"""
-    results = load_results(output_dir, project_name, user, hostname)
-    cc, hw, en, rate = format_summary(results)
-    energy, energy_unit = en.split(" ")
-    print_custom_paper_statement(cc, hw, float(energy), energy_unit, rate)
+    # the aggregated summary provides all information for the statement, with memory bounded by the chunk size instead of the number of results
+    results = load_summary(output_dir, project_name, user, hostname, backend, chunksize)
+    return print_custom_paper_statement(*statement_figures(hardware_summary(results)))
+
+def batch_paper_statements(output_dir=DEFAULT_OUTPUT_DIR, by=('project_name',), backend='csv', chunksize=100_000, project_name=None, user=None, hostname=None):
+    """Computes the statements and figures of all projects (or all combinations of the given fields) from a single summary pass, optionally only for the given project, user and host"""
+    import pandas as pd
+    groups = {}
+    for group in hardware_summary(load_summary(output_dir, project_name, user, hostname, backend, chunksize), list(by)):
+        groups.setdefault(tuple(group[field] for field in by), []).append(group)
+    rows = []
+    for key, key_groups in groups.items():
+        figures = statement_figures(key_groups)
+        rows.append({
+            **dict(zip(by, key)),
+            'methodology': figures[0],
+            # single configurations already join CPU and GPU with "and"
+            'hardware': "; ".join(group['hardware'] for group in key_groups),
+            'energy_consumed': sum(group['energy_consumed'] for group in key_groups),
+            'emissions': sum(group['emissions'] for group in key_groups),
+            'rate': figures[4],
+            'count': sum(group['count'] for group in key_groups),
+            'statement': format_paper_statement(*figures)
+        })
+    return pd.DataFrame(rows, columns=list(by) + ['methodology', 'hardware', 'energy_consumed', 'emissions', 'rate', 'count', 'statement'])
+
+LATEX_SPECIAL = {'\\': r'\textbackslash{}', '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#', '_': r'\_', '{': r'\{', '}': r'\}', '~': r'\textasciitilde{}', '^': r'\textasciicircum{}'}
+
+def latex_table(statements):
+    """Renders the figures of batch_paper_statements as LaTeX table"""
+    escape = lambda value: "".join(LATEX_SPECIAL.get(char, char) for char in str(value))
+    fields = [col for col in statements.columns if col not in ['methodology', 'hardware', 'energy_consumed', 'emissions', 'rate', 'count', 'statement']]
+    header = [field.replace('_', ' ').capitalize() for field in fields] + ['Hardware', 'Energy (kWh)', r'Emissions (kgCO$_2$e)', r'Intensity (gCO$_2$/kWh)', 'Runs']
+    lines = [r"\begin{tabular}{" + "l" * (len(fields) + 1) + "rrrr}", r"\toprule", " & ".join(header) + r" \\", r"\midrule"]
+    for row in statements.to_dict('records'):
+        cells = [escape(row[field]) for field in fields] + [escape(row['hardware']), f"{row['energy_consumed']:.3f}", f"{row['emissions']:.3f}", str(row['rate']), str(row['count'])]
+        lines.append(" & ".join(cells) + r" \\")
+    lines += [r"\bottomrule", r"\end{tabular}"]
+    return "\n".join(lines) + "\n"
+
+def write_batch_paper_statements(statements, target_dir):
+    """Writes all statements into a text file, and their figures into a CSV and LaTeX table"""
+    os.makedirs(target_dir, exist_ok=True)
+    with open(os.path.join(target_dir, 'paper_statements.txt'), 'w') as wf:
+        for row in statements.to_dict('records'):
+            key = ", ".join(str(row[field]) for field in statements.columns[:statements.columns.get_loc('methodology')])
+            wf.write(f"% {key}\n{row['statement']}\n\n")
+    statements.drop(columns='statement').to_csv(os.path.join(target_dir, 'paper_statements.csv'), index=False)
+    with open(os.path.join(target_dir, 'paper_statements.tex'), 'w') as wf:
+        wf.write(latex_table(statements))
 
 COMPARISONS = {
     "text_message": {
@@ -144,6 +193,11 @@ def emission_comparisons(
     return random.sample(rendered, k=min(len(rendered), max_results))
 
 def print_custom_paper_statement(methodology, hardware, consumed_energy, energy_unit="kWh", carbon_intensity=380):
+    output = format_paper_statement(methodology, hardware, consumed_energy, energy_unit, carbon_intensity)
+    print("\n" + output + "\n")
+    return output
+
+def format_paper_statement(methodology, hardware, consumed_energy, energy_unit="kWh", carbon_intensity=380):
     emissions = carbon_intensity * consumed_energy
     comps = emission_comparisons(emissions)
     if energy_unit == "Wh":
@@ -160,36 +214,81 @@ def print_custom_paper_statement(methodology, hardware, consumed_energy, energy_
     if comps:
         output += f"\n\nFor comparison, this is {comps[0]}. Comparisons are based on ``How bad are bananas? The Carbon Footprint of everything'' by Mike Berners-Lee. Greystone Books 2011.\n" 
     
-    print("\n" + output + "\n")
     return output
     
+def print_combined_paper_statement(groups):
+    """Prints a single statement for experiments on several hardware configurations, as returned by hardware_summary"""
+    return print_custom_paper_statement(*statement_figures(groups))
+
+def statement_figures(groups):
+    """Methodology, hardware, energy, energy unit and carbon intensity for the statement of one or several hardware configurations"""
+    methodology = " and ".join(dict.fromkeys(group['methodology'] for group in groups))
+    if len(groups) > 1:
+        hardware = [f"{group['hardware']} ({group['energy'].strip()})" for group in groups]
+        hardware = ", an ".join(hardware[:-1]) + " and an " + hardware[-1]
+    else:
+        hardware = groups[0]['hardware']
+    energy_consumed = sum(group['energy_consumed'] for group in groups)
+    if len(groups) == 1:
+        carbon_intensity = groups[0]['rate']
+    else:
+        carbon_intensity = int(sum(group['emissions'] for group in groups) / energy_consumed * 1000) if energy_consumed > 0 else 0 # gCO2/kWh
+    energy, energy_unit = format_energy(energy_consumed).split()
+    return methodology, hardware, float(energy), energy_unit, carbon_intensity
+
+def format_energy(energy_consumed):
+    return f"{energy_consumed:5.3f} kWh" if energy_consumed > 0.1 else f"{energy_consumed*1000:5.3f} Wh"
+
+HARDWARE_KEYS = ['codecarbon_version', 'cpu_model', 'gpu_model']
+
+def hardware_summary(results, by=()):
+    """Energy, emissions and carbon intensity per methodology and hardware configuration (and the given fields), computed in a single grouped pass over (aggregated) results"""
+    counts = results['count'] if 'count' in results.columns else 1
+    groups = results.assign(count=counts).groupby(list(by) + HARDWARE_KEYS, dropna=False, sort=False, observed=True)[['energy_consumed', 'emissions', 'count']].sum().reset_index()
+    hardware = groups['cpu_model'].astype(str).str.split(' @ ').str[0]
+    hardware = hardware.where(groups['gpu_model'].isna(), hardware + " and " + groups['gpu_model'].astype(str))
+    return [{
+        **{field: group[field] for field in by},
+        'methodology': f"CodeCarbon {group['codecarbon_version']}",
+        'hardware': hw,
+        'energy': format_energy(group['energy_consumed']),
+        'rate': int(group['emissions'] / group['energy_consumed'] * 1000) if group['energy_consumed'] > 0 else 0, # gCO2/kWh
+        'energy_consumed': float(group['energy_consumed']),
+        'emissions': float(group['emissions']),
+        'count': int(group['count'])
+    } for group, hw in zip(groups.to_dict('records'), hardware)]
+
 def format_summary(results):
-    cc = f"CodeCarbon {results['codecarbon_version'].iloc[0]}"
-    # get hardware info
-    assert pd.unique(results['cpu_model']).size == 1, "Multiple CPU models found in results"
-    assert pd.unique(results['gpu_model']).size == 1, "Multiple GPU models found in results"
-    hw = results['cpu_model'].iloc[0].split(' @ ')[0]
-    if not pd.isna(results['gpu_model'].iloc[0]):
-        hw = hw + f" and {results['gpu_model'].iloc[0]}"
-    # get emissions and energy
-    en = f"{results['energy_consumed'].sum():5.3f} kWh" if results['energy_consumed'].sum() > 0.1 else f"{results['energy_consumed'].sum()*1000:5.3f} Wh"
-    rate = int(results['emissions'].sum()/results['energy_consumed'].sum()*1000) # gCO2/kWh
-    return cc, hw, en, rate
+    """Methodology, hardware, energy and carbon intensity of results on a single hardware configuration"""
+    groups = hardware_summary(results)
+    if len(groups) > 1:
+        raise ValueError("Multiple hardware configurations found in results, please use hardware_summary instead")
+    return groups[0]['methodology'], groups[0]['hardware'], groups[0]['energy'], groups[0]['rate']
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Print a paper statement summarizing energy and carbon emissions of tracked experiments. You can either use logs from the tracker, or provide custom information (pass values for methodology, hardware, and energy).")
 
-    parser.add_argument("--output_dir", type=str, default=os.path.join(Path.home(), ".let"), help="Path to the output directory (default: ~/.let)")
+    parser.add_argument("--output_dir", type=str, nargs="+", default=[DEFAULT_OUTPUT_DIR], help="Path to the output directory (default: ~/.let), or several directories or glob patterns, the results of which are merged")
     parser.add_argument("--project_name", type=str, default=None, help="Name of the project")
     parser.add_argument("--user", type=str, default=None, help="User name")
     parser.add_argument("--hostname", type=str, default=None, help="Hostname")
+    parser.add_argument("--backend", type=str, default="csv", help="Storage backend of the tracked results (e.g., csv, parquet or sqlite)")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="Number of results that are aggregated at once, which bounds the memory usage")
+    parser.add_argument("--batch", type=str, default=None, choices=["project", "experiment"], help="Write the statements of all projects (or all combinations of project, user and host) at once")
+    parser.add_argument("--batch_dir", type=str, default=".", help="Directory for the batch statements and their CSV and LaTeX table")
     parser.add_argument("--methodology", type=str, default=None, help="Methodology for energy estimation (e.g., CodeCarbon or ML Impact Calculator)")
     parser.add_argument("--hardware", type=str, default=None, help="Information on experiment hardware (e.g., CPU or GPU type)")
     parser.add_argument("--consumed_energy", type=float, default=None, help="Information on consumed energy (in kWh)")
     parser.add_argument("--carbon_intensity", type=int, default=380, help="Information on carbon intensity (in gCO2/kWh)")
 
     args = parser.parse_args()
+    output_dir = args.output_dir[0] if len(args.output_dir) == 1 else args.output_dir
     if args.methodology is not None and args.hardware is not None and args.consumed_energy is not None:
         print_custom_paper_statement(args.methodology, args.hardware, args.consumed_energy, carbon_intensity=args.carbon_intensity)
+    elif args.batch is not None:
+        by = ['project_name'] if args.batch == 'project' else ['project_name', 'user', 'hostname']
+        statements = batch_paper_statements(output_dir, by, args.backend, args.chunksize, args.project_name, args.user, args.hostname)
+        write_batch_paper_statements(statements, args.batch_dir)
+        print(f"Wrote {len(statements)} statements and their tables to {args.batch_dir}")
     else:
-        print_paper_statement(args.output_dir, args.project_name, args.user, args.hostname)
\ No newline at end of file
+        print_paper_statement(output_dir, args.project_name, args.user, args.hostname, args.backend, args.chunksize)
\ No newline at end of file
@@ -0,0 +1,767 @@
+"""
+Pluggable storage backends for tracked results
+"""
+from abc import ABC, abstractmethod
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, contextmanager
+import glob
+import io
+import json
+import os
+from pathlib import Path
+import shutil
+import socket
+import sqlite3
+import time
+from urllib.parse import quote
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where concurrent writers are not coordinated
+    fcntl = None
+
+from lamarr_energy_tracker import DEFAULT_OUTPUT_DIR
+
+ID_SEPARATOR = '___'
+ID_FIELDS = ['project_name', 'user', 'hostname']
+
+# columns of the rows written by CodeCarbon, by type
+STRING_COLUMNS = [
+    'timestamp', 'project_name', 'run_id', 'experiment_id', 'country_name', 'country_iso_code', 'region',
+    'cloud_provider', 'cloud_region', 'os', 'python_version', 'codecarbon_version', 'cpu_model', 'gpu_model',
+    'tracking_mode', 'on_cloud'
+]
+FLOAT_COLUMNS = [
+    'duration', 'emissions', 'emissions_rate', 'cpu_power', 'gpu_power', 'ram_power', 'cpu_energy', 'gpu_energy',
+    'ram_energy', 'energy_consumed', 'water_consumed', 'cpu_count', 'gpu_count', 'longitude', 'latitude',
+    'ram_total_size', 'cpu_utilization_percent', 'gpu_utilization_percent', 'ram_utilization_percent', 'ram_used_gb',
+    'pue', 'wue'
+]
+# additional string columns of each table, e.g., sections of a run are stored separately and linked to their run
+TABLES = {
+    'emissions': [],
+    'sections': ['section', 'parent_run_id'],
+    'groundtruth': ['start_time']
+}
+# high-cardinality string columns, all other string columns are stored as categories
+UNIQUE_COLUMNS = ['timestamp', 'run_id', 'parent_run_id', 'start_time']
+DTYPES = {
+    **{col: 'category' for columns in TABLES.values() for col in columns if col not in UNIQUE_COLUMNS},
+    **{col: 'category' for col in STRING_COLUMNS if col not in UNIQUE_COLUMNS},
+    **{col: str for col in UNIQUE_COLUMNS},
+    **{col: 'float64' for col in FLOAT_COLUMNS}
+}
+
+
+def split_experiment_id(results):
+    """Maps the experiment_id of every row to categorical project_name, user and hostname columns"""
+    ids = results['experiment_id'].astype('category')
+    # only the unique experiment ids need to be split, rows are mapped via their category codes
+    parts = ids.cat.categories.to_series().str.split(ID_SEPARATOR, n=len(ID_FIELDS) - 1, expand=True)
+    codes = ids.cat.codes.to_numpy()
+    for idx, field in enumerate(ID_FIELDS):
+        values = parts[idx] if idx in parts.columns else pd.Series(None, index=parts.index, dtype=object)
+        field_codes, categories = pd.factorize(values)
+        # missing experiment ids have code -1, which selects the appended missing value code
+        field_codes = np.append(field_codes, -1)[codes]
+        results[field] = pd.Categorical.from_codes(field_codes, categories=categories)
+    return results
+
+
+def filter_results(results, project_name=None, user=None, hostname=None):
+    """Only keeps the rows matching the given project_name, user and hostname, in a single pass"""
+    mask = None
+    for field, value in zip(ID_FIELDS, [project_name, user, hostname]):
+        if value is not None:
+            matches = (results[field] == value).to_numpy()
+            mask = matches if mask is None else mask & matches
+    return results if mask is None else results.loc[mask]
+
+
+# paper statements only need the sums of energy and emissions per project, user, host, methodology and hardware
+SUMMARY_KEYS = ID_FIELDS + ['codecarbon_version', 'cpu_model', 'gpu_model']
+SUMMARY_VALUES = ['energy_consumed', 'emissions']
+# number of rows that are processed at once when streaming through large result files
+CHUNKSIZE = 100_000
+
+
+def aggregate_results(results):
+    """Sums up the energy and emissions of (already aggregated) results per summary key, keeping the order of appearance"""
+    counts = results['count'] if 'count' in results.columns else pd.Series(1, index=results.index)
+    results = results[SUMMARY_KEYS + SUMMARY_VALUES].assign(count=counts)
+    summary = results.groupby(SUMMARY_KEYS, dropna=False, sort=False, observed=True)[SUMMARY_VALUES + ['count']].sum()
+    return summary.reset_index()
+
+
+def merge_summaries(*summaries):
+    """Merges several aggregated summaries into one"""
+    # empty frames are skipped, since concatenating them is deprecated in older pandas versions
+    summaries = [summary for summary in summaries if len(summary) > 0]
+    if len(summaries) == 0:
+        return pd.DataFrame(columns=SUMMARY_KEYS + SUMMARY_VALUES + ['count'])
+    return aggregate_results(pd.concat(summaries, ignore_index=True))
+
+
+def aggregate_csv(source, chunksize=CHUNKSIZE, names=None):
+    """Aggregates a CSV file chunk by chunk, such that the memory only depends on the chunk size and the number of groups"""
+    summary = merge_summaries()
+    for chunk in pd.read_csv(source, names=names, usecols=_file_columns(SUMMARY_KEYS + SUMMARY_VALUES), dtype=DTYPES, chunksize=chunksize):
+        summary = merge_summaries(summary, aggregate_results(split_experiment_id(chunk)))
+    return summary
+
+
+class FileRange(io.RawIOBase):
+    """Reads a file from its current position up to the given end offset"""
+
+    def __init__(self, rf, end):
+        self.rf = rf
+        self.end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.rf.read(max(min(len(buffer), self.end - self.rf.tell()), 0))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _complete_lines_end(rf, start, block_size=65536):
+    """Offset behind the last complete line of the file, searched backwards from its end"""
+    end = rf.seek(0, os.SEEK_END)
+    while end > start:
+        block_start = max(end - block_size, start)
+        rf.seek(block_start)
+        idx = rf.read(end - block_start).rfind(b'\n')
+        if idx >= 0:
+            return block_start + idx + 1
+        end = block_start
+    return start
+
+
+def apply_dtypes(results):
+    """Converts all known columns to their fixed dtypes"""
+    return results.astype({col: dtype for col, dtype in DTYPES.items() if col in results.columns and col not in ID_FIELDS})
+
+
+def _as_frame(rows):
+    return rows if isinstance(rows, pd.DataFrame) else pd.DataFrame.from_records(rows)
+
+
+def _file_columns(columns):
+    # the id fields are derived from the experiment_id, which thus always has to be read
+    if columns is None:
+        return None
+    return [col for col in columns if col not in ID_FIELDS] + ['experiment_id']
+
+
+def _size(path):
+    # files may be removed by a concurrent compaction while listing them
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def deduplicate_runs(rows):
+    """
+    Keeps a single row of every run_id, which is the same for all backends: the latest write of the run (by its timestamp,
+    e.g., the final results after several flushes), and the first stored one of several writes with the same timestamp
+    """
+    rows = rows.reset_index(drop=True)
+    latest = rows.sort_values('timestamp', ascending=False, kind='stable').drop_duplicates('run_id')
+    return rows.loc[latest.index.sort_values()].reset_index(drop=True)
+
+
+@contextmanager
+def locked_file(path, mode='a'):
+    """
+    Opens the file while holding an exclusive lock on it. Files that were replaced (e.g., renamed for compaction) while
+    waiting for the lock are reopened, such that rows are never written to files that are no longer in place.
+    """
+    while True:
+        lf = open(path, mode, newline='')
+        if fcntl is None:
+            break
+        fcntl.flock(lf, fcntl.LOCK_EX)
+        try:
+            if os.path.samestat(os.fstat(lf.fileno()), os.stat(path)):
+                break
+        except FileNotFoundError:
+            if 'r' in mode:
+                lf.close()
+                raise
+        lf.close()
+    try:
+        yield lf
+    finally:
+        # closing the file releases the lock
+        lf.close()
+
+
+class ResultsStore(ABC):
+    """Base class for all result storage backends, which have to implement at least exists, append, read and delete"""
+
+    backend = None
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, shard=False, table='emissions'):
+        if table not in TABLES:
+            raise ValueError(f"[ResultsStore] Unknown table '{table}', please choose one of {list(TABLES.keys())}")
+        self.output_dir = output_dir
+        self.shard = shard
+        self.table = table
+
+    @abstractmethod
+    def exists(self):
+        """Check whether any results have been stored"""
+
+    @abstractmethod
+    def append(self, rows):
+        """Append a DataFrame or a list of dicts with CodeCarbon results"""
+
+    @abstractmethod
+    def read(self, columns=None, project_name=None, user=None, hostname=None):
+        """Read the stored results, optionally only loading the given columns and rows of the given project, user and host"""
+
+    @abstractmethod
+    def delete(self):
+        """Delete all stored results"""
+
+    def summary(self, project_name=None, user=None, hostname=None, chunksize=CHUNKSIZE):
+        """Aggregated energy and emissions per project, user, host, methodology and hardware"""
+        results = self.read(SUMMARY_KEYS + SUMMARY_VALUES, project_name, user, hostname)
+        return aggregate_results(results)
+
+    def compact(self):
+        """Merge all separately written results into the main store, deduplicated on run_id via deduplicate_runs, and return their number"""
+        return 0
+
+
+class CSVResultsStore(ResultsStore):
+    """
+    Stores all results in a single emissions.csv file, which stays compatible with CodeCarbon.
+    In shard mode, every process instead appends to its own file in emissions_shards/, such that concurrent
+    processes never interleave rows. Shards are read together with the main file, until they are compacted.
+    """
+
+    backend = 'csv'
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, shard=False, table='emissions'):
+        super().__init__(output_dir, shard, table)
+        self.path = os.path.join(output_dir, f'{table}.csv')
+        self.summary_path = os.path.join(output_dir, f'{table}_summary.json')
+        self.shard_dir = os.path.join(output_dir, f'{table}_shards')
+        self.shard_id = uuid.uuid4().hex[:8]
+
+    def exists(self):
+        return (os.path.isfile(self.path) and os.path.getsize(self.path) > 0) or len(self.shards()) > 0
+
+    def header(self, path=None):
+        with open(path or self.path, 'r') as rf:
+            return rf.readline().strip().split(',')
+
+    def shards(self, suffixes=('.csv', '.compacting'), empty=False):
+        """All shard files, including the ones that are currently compacted, but not the ones that are just being created"""
+        if not os.path.isdir(self.shard_dir):
+            return []
+        return sorted(str(path) for path in Path(self.shard_dir).iterdir() if path.name.endswith(suffixes) and (empty or _size(path) > 0))
+
+    def shard_path(self):
+        # the process id is resolved on every write, such that forked processes do not share a shard
+        return os.path.join(self.shard_dir, f'{socket.gethostname()}_{os.getpid()}_{self.shard_id}.csv')
+
+    def append(self, rows):
+        if self.shard:
+            os.makedirs(self.shard_dir, exist_ok=True)
+            self._append(self.shard_path(), _as_frame(rows))
+        else:
+            self._append(self.path, _as_frame(rows))
+
+    def _append(self, path, rows):
+        # the header is only checked while holding the lock, such that a file is never continued without its header
+        with locked_file(path) as wf:
+            if self._write(wf, path, rows):
+                return
+        # like writers that waited for the lock of the backup, the rows start a new file
+        self._append(path, rows)
+
+    def _write(self, wf, path, rows):
+        """Appends the rows to the locked file, or backs it up and returns False if its format has changed"""
+        header = self.header(path) if os.fstat(wf.fileno()).st_size > 0 else None
+        if header is not None and sorted(header) != sorted(rows.columns):
+            print(f"[ResultsStore] The CSV format has changed, backing up {path}")
+            self._backup(path)
+            return False
+        # only appends the new rows instead of rewriting the whole file
+        rows[header or list(rows.columns)].to_csv(wf, header=header is None, index=False)
+        return True
+
+    def read(self, columns=None, project_name=None, user=None, hostname=None):
+        shards = self.shards()
+        paths = ([self.path] if os.path.exists(self.path) or not shards else []) + shards
+        results = [pd.read_csv(path, usecols=_file_columns(columns), dtype=DTYPES) for path in paths]
+        # concatenating categories of different files results in plain objects
+        results = results[0] if len(results) == 1 else apply_dtypes(pd.concat(results, ignore_index=True))
+        results = split_experiment_id(results)
+        return filter_results(results, project_name, user, hostname)
+
+    def delete(self):
+        shards = self.shards()
+        if os.path.exists(self.path) or not shards:
+            os.remove(self.path)
+        if os.path.isdir(self.shard_dir):
+            shutil.rmtree(self.shard_dir)
+        self._invalidate_summary()
+
+    def compact(self):
+        """
+        Appends the rows of all shards to emissions.csv and deletes the shards. Every shard is renamed while holding its lock,
+        such that processes that are still running continue writing to a new shard, and emissions.csv is locked until all
+        renamed shards are merged. Runs that are written several times (e.g., via flush, or by an interrupted compaction)
+        are deduplicated via deduplicate_runs, so emissions.csv is only rewritten if a shard holds a later write of its runs.
+        """
+        for path in self.shards(('.csv',), empty=True):
+            try:
+                with locked_file(path, 'r'):
+                    os.rename(path, f'{path}.compacting')
+            except FileNotFoundError:
+                pass # renamed by another compaction
+        shards = self.shards(('.compacting',), empty=True)
+        if len(self.shards(('.compacting',))) == 0:
+            # shards that were created but never written (e.g., renamed while their writer waited for the lock) are only deleted
+            for path in shards:
+                if os.path.exists(path):
+                    os.remove(path)
+            return 0
+        with locked_file(self.path) as wf:
+            # listed again while holding the lock, as another compaction may have merged them in the meantime
+            shards = self.shards(('.compacting',), empty=True)
+            rows = [pd.read_csv(path, dtype=DTYPES) for path in shards if os.path.getsize(path) > 0]
+            rows = deduplicate_runs(apply_dtypes(pd.concat(rows, ignore_index=True))) if rows else pd.DataFrame(columns=['run_id', 'timestamp'])
+            stored = pd.read_csv(self.path, usecols=['run_id', 'timestamp'], dtype=DTYPES) if os.fstat(wf.fileno()).st_size > 0 else None
+            merged = len(rows) == 0
+            if stored is not None:
+                stored_timestamps = rows['run_id'].map(stored.groupby('run_id')['timestamp'].max())
+                if (rows['timestamp'] > stored_timestamps).any():
+                    self._rewrite(rows)
+                    merged = True
+                else:
+                    rows = rows[stored_timestamps.isna()]
+            merged = merged or len(rows) == 0 or self._write(wf, self.path, rows)
+            for path in shards:
+                os.remove(path)
+        if not merged:
+            self._append(self.path, rows)
+        return len(rows)
+
+    def _rewrite(self, rows):
+        """Replaces emissions.csv (while holding its lock) by its rows merged with the given ones"""
+        rows = deduplicate_runs(apply_dtypes(pd.concat([pd.read_csv(self.path, dtype=DTYPES), rows], ignore_index=True)))
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        rows.to_csv(tmp_path, index=False)
+        # writers that wait for the lock of the replaced file reopen the new one
+        os.replace(tmp_path, self.path)
+        self._invalidate_summary()
+
+    def summary(self, project_name=None, user=None, hostname=None, chunksize=CHUNKSIZE):
+        """Aggregated results, which are incrementally updated from all rows appended since the last call"""
+        shards = self.shards()
+        summary = self._main_summary(chunksize) if os.path.exists(self.path) or not shards else merge_summaries()
+        # shards are small until compacted, so they are aggregated on every call
+        summary = merge_summaries(summary, *[aggregate_csv(path, chunksize) for path in shards])
+        return filter_results(summary, project_name, user, hostname).reset_index(drop=True)
+
+    def _main_summary(self, chunksize=CHUNKSIZE):
+        with open(self.path, 'rb') as rf:
+            header = rf.readline()
+            cache = self._load_summary(rf, header)
+            # incomplete lines are currently written by another process, and processed in the next call
+            end = _complete_lines_end(rf, cache['offset'])
+            summary = pd.DataFrame(cache['groups'], columns=SUMMARY_KEYS + SUMMARY_VALUES + ['count'])
+            if end > cache['offset']:
+                # the new rows are streamed from the file instead of being read at once
+                rf.seek(cache['offset'])
+                new_rows = io.BufferedReader(FileRange(rf, end))
+                summary = merge_summaries(summary, aggregate_csv(new_rows, chunksize, names=header.decode().strip().split(',')))
+        if end > cache['offset']:
+            self._store_summary(header, end, summary)
+        return summary
+
+    def _load_summary(self, rf, header):
+        # the cache is only valid if the file was not truncated or rewritten since the last update
+        try:
+            with open(self.summary_path, 'r') as cf:
+                cache = json.load(cf)
+            fingerprint = cache['fingerprint'].encode('latin-1')
+            rf.seek(cache['offset'] - len(fingerprint))
+            if cache['header'] == header.decode() and rf.read(len(fingerprint)) == fingerprint:
+                return cache
+        except (OSError, ValueError, KeyError):
+            pass
+        return {'offset': len(header), 'groups': []}
+
+    def _store_summary(self, header, offset, summary):
+        with open(self.path, 'rb') as rf:
+            rf.seek(max(offset - 256, 0))
+            fingerprint = rf.read(offset - max(offset - 256, 0))
+        groups = summary.astype(object).where(summary.notna(), None).to_dict('records')
+        cache = {'header': header.decode(), 'offset': offset, 'fingerprint': fingerprint.decode('latin-1'), 'groups': groups}
+        # replace the cache atomically, such that concurrent readers never see partial files
+        tmp_path = f'{self.summary_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as cf:
+            json.dump(cache, cf)
+        os.replace(tmp_path, self.summary_path)
+
+    def _invalidate_summary(self):
+        if os.path.exists(self.summary_path):
+            os.remove(self.summary_path)
+
+    def _backup(self, path):
+        backup_path, idx = f'{path}.bak', 0
+        while os.path.exists(backup_path):
+            backup_path, idx = f'{path}_{idx}.bak', idx + 1
+        os.rename(path, backup_path)
+        if path == self.path:
+            self._invalidate_summary()
+
+
+class ParquetResultsStore(ResultsStore):
+    """
+    Stores every appended batch of results as a small Parquet segment, partitioned by project_name, user and hostname.
+    Reads only load the requested columns and skip all segments of non-matching partitions. Requires pyarrow.
+    """
+
+    backend = 'parquet'
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, shard=False, table='emissions'):
+        # segments are uniquely named per process and written atomically, so every write is already sharded
+        super().__init__(output_dir, shard, table)
+        try:
+            import pyarrow
+        except ImportError:
+            raise RuntimeError("[ResultsStore] The parquet backend requires pyarrow, please install it via `pip install lamarr-energy-tracker[parquet]`")
+        self.path = os.path.join(output_dir, f'{table}.parquet')
+
+    def exists(self):
+        return any(self._segments())
+
+    def _segments(self):
+        # hidden files are temporary segments that are currently written
+        return (path for path in Path(self.path).rglob('*.parquet') if not path.name.startswith('.'))
+
+    def _schema(self, columns):
+        import pyarrow as pa
+        return pa.schema([(col, pa.float64() if col in FLOAT_COLUMNS else pa.string()) for col in columns])
+
+    def _partitioning(self):
+        import pyarrow.dataset as ds
+        return ds.partitioning(self._schema(ID_FIELDS), flavor='hive')
+
+    def append(self, rows):
+        rows = split_experiment_id(_as_frame(rows).copy())
+        for keys, segment in rows.groupby(ID_FIELDS, sort=False, observed=True):
+            partition = os.path.join(self.path, *[f'{field}={quote(str(key), safe="")}' for field, key in zip(ID_FIELDS, keys)])
+            self._write_segment(partition, segment)
+
+    def _write_segment(self, partition, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # the codecarbon project_name column is superseded by the one in the experiment_id
+        columns = [col for col in rows.columns if col not in ID_FIELDS]
+        rows = rows[columns].copy()
+        for col in columns:
+            if col in FLOAT_COLUMNS:
+                rows[col] = pd.to_numeric(rows[col], errors='coerce')
+            else:
+                rows[col] = rows[col].astype(object).where(rows[col].notna(), None)
+        os.makedirs(partition, exist_ok=True)
+        name = f'{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet'
+        table = pa.Table.from_pandas(rows, schema=self._schema(columns), preserve_index=False)
+        # write to a hidden file first, such that readers never see incomplete segments
+        pq.write_table(table, os.path.join(partition, f'.{name}'))
+        os.replace(os.path.join(partition, f'.{name}'), os.path.join(partition, name))
+
+    def _dataset(self):
+        import pyarrow.dataset as ds
+        schema = self._schema([col for col in STRING_COLUMNS + TABLES[self.table] + FLOAT_COLUMNS if col not in ID_FIELDS] + ID_FIELDS)
+        return ds.dataset(self.path, schema=schema, format='parquet', partitioning=self._partitioning())
+
+    def _predicate(self, project_name=None, user=None, hostname=None):
+        import pyarrow.dataset as ds
+        predicate = None
+        for field, value in zip(ID_FIELDS, [project_name, user, hostname]):
+            if value is not None:
+                expr = ds.field(field) == value
+                predicate = expr if predicate is None else predicate & expr
+        return predicate
+
+    def read(self, columns=None, project_name=None, user=None, hostname=None):
+        if columns is not None:
+            # like for CSV files, the id fields are always included
+            columns = list(dict.fromkeys(list(columns) + ['experiment_id'] + ID_FIELDS))
+        if not self.exists():
+            schema = self._schema([col for col in STRING_COLUMNS + TABLES[self.table] + FLOAT_COLUMNS if col not in ID_FIELDS] + ID_FIELDS)
+            return schema.empty_table().to_pandas()[columns or schema.names]
+        results = apply_dtypes(self._dataset().to_table(columns=columns, filter=self._predicate(project_name, user, hostname)).to_pandas())
+        return results.astype({field: 'category' for field in ID_FIELDS if field in results.columns})
+
+    def summary(self, project_name=None, user=None, hostname=None, chunksize=CHUNKSIZE):
+        """Aggregated results, computed batch by batch, such that the memory only depends on the chunk size and the number of groups"""
+        summary = merge_summaries()
+        if not self.exists():
+            return summary
+        batches = self._dataset().to_batches(columns=SUMMARY_KEYS + SUMMARY_VALUES, filter=self._predicate(project_name, user, hostname), batch_size=chunksize)
+        for batch in batches:
+            summary = merge_summaries(summary, aggregate_results(batch.to_pandas()))
+        return summary
+
+    def delete(self):
+        shutil.rmtree(self.path)
+
+    def compact(self):
+        """Merges all segments of each partition into a single one"""
+        import pyarrow.parquet as pq
+        partitions = {}
+        # segments are named by their time of writing, so their rows are deduplicated in the order of writing
+        for segment in sorted(self._segments()):
+            partitions.setdefault(segment.parent, []).append(segment)
+        compacted = 0
+        for partition, segments in partitions.items():
+            if len(segments) > 1:
+                rows = pd.concat([pq.read_table(segment).to_pandas() for segment in segments], ignore_index=True)
+                rows = deduplicate_runs(rows)
+                self._write_segment(str(partition), rows)
+                for segment in segments:
+                    os.remove(segment)
+                compacted += len(rows)
+        return compacted
+
+
+class SQLiteResultsStore(ResultsStore):
+    """
+    Stores the results of all tables in a single results.sqlite database, with the project_name, user and hostname of every row
+    in separate indexed columns. The database uses write-ahead logging, such that concurrent processes can append while others read.
+    Filters, time ranges and the aggregations for summaries are evaluated in SQL.
+    """
+
+    backend = 'sqlite'
+    INDEXED_COLUMNS = ID_FIELDS + ['timestamp', 'run_id']
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, shard=False, table='emissions'):
+        # every write is a transaction, so concurrent processes never interleave rows and sharding is not needed
+        super().__init__(output_dir, shard, table)
+        self.path = os.path.join(output_dir, 'results.sqlite')
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _columns(self, connection):
+        return [row[1] for row in connection.execute(f'PRAGMA table_info("{self.table}")')]
+
+    def _create(self, connection, columns):
+        """Creates the table and its indexes if needed, and adds all given columns that are not yet part of it"""
+        existing = self._columns(connection)
+        if not existing:
+            columns = list(dict.fromkeys(ID_FIELDS + [col for col in STRING_COLUMNS + TABLES[self.table] + FLOAT_COLUMNS if col not in ID_FIELDS] + columns))
+            definition = ', '.join(f'"{col}" {"REAL" if col in FLOAT_COLUMNS else "TEXT"}' for col in columns)
+            connection.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" ({definition})')
+            for col in self.INDEXED_COLUMNS:
+                connection.execute(f'CREATE INDEX IF NOT EXISTS "{self.table}_{col}" ON "{self.table}" ("{col}")')
+            return
+        for col in columns:
+            if col not in existing:
+                connection.execute(f'ALTER TABLE "{self.table}" ADD COLUMN "{col}" {"REAL" if col in FLOAT_COLUMNS else "TEXT"}')
+
+    def exists(self):
+        if not os.path.isfile(self.path):
+            return False
+        with closing(self.connect()) as connection:
+            return bool(self._columns(connection)) and connection.execute(f'SELECT 1 FROM "{self.table}" LIMIT 1').fetchone() is not None
+
+    def append(self, rows):
+        # the codecarbon project_name column is superseded by the one in the experiment_id
+        rows = split_experiment_id(_as_frame(rows).drop(columns='project_name', errors='ignore'))
+        columns = list(rows.columns)
+        values = {}
+        for col in columns:
+            if col in FLOAT_COLUMNS:
+                values[col] = pd.to_numeric(rows[col], errors='coerce').astype(object)
+            else:
+                values[col] = rows[col].astype(str).astype(object)
+            values[col] = values[col].where(rows[col].notna(), None)
+        records = zip(*[values[col] for col in columns])
+        names, placeholders = ', '.join(f'"{col}"' for col in columns), ', '.join('?' for _ in columns)
+        with closing(self.connect()) as connection, connection:
+            self._create(connection, columns)
+            connection.executemany(f'INSERT INTO "{self.table}" ({names}) VALUES ({placeholders})', records)
+
+    def _where(self, project_name=None, user=None, hostname=None, since=None, until=None):
+        conditions, params = [], []
+        for field, value in zip(ID_FIELDS, [project_name, user, hostname]):
+            if value is not None:
+                conditions.append(f'"{field}" = ?')
+                params.append(value)
+        # timestamps are ISO formatted, so they are ordered as strings
+        for operator, value in [('>=', since), ('<', until)]:
+            if value is not None:
+                conditions.append(f'"timestamp" {operator} ?')
+                params.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    def query(self, columns=None, project_name=None, user=None, hostname=None, since=None, until=None, by=None):
+        """
+        Results of the given project, user and host within the time range [since, until), either as rows or,
+        if grouping columns are given via by, as sums of energy and emissions with the number of results per group
+        """
+        if columns is not None:
+            # like for CSV files, the id fields are always included
+            columns = list(dict.fromkeys(list(columns) + ['experiment_id'] + ID_FIELDS))
+        if not self.exists():
+            empty = pd.DataFrame(columns=(list(by) + SUMMARY_VALUES + ['count']) if by else columns or [])
+            return apply_dtypes(empty)
+        where, params = self._where(project_name, user, hostname, since, until)
+        with closing(self.connect()) as connection:
+            if by:
+                keys = ', '.join(f'"{col}"' for col in by)
+                sums = ', '.join(f'SUM("{col}") AS "{col}"' for col in SUMMARY_VALUES)
+                # groups are ordered by their first appearance, like the summaries of the other backends
+                sql = f'SELECT {keys}, {sums}, COUNT(*) AS "count" FROM "{self.table}"{where} GROUP BY {keys} ORDER BY MIN(rowid)'
+            else:
+                selected = ', '.join(f'"{col}"' for col in columns) if columns else '*'
+                sql = f'SELECT {selected} FROM "{self.table}"{where} ORDER BY rowid'
+            results = pd.read_sql_query(sql, connection, params=params)
+        results = apply_dtypes(results)
+        return results.astype({field: 'category' for field in ID_FIELDS if field in results.columns})
+
+    def read(self, columns=None, project_name=None, user=None, hostname=None):
+        return self.query(columns, project_name, user, hostname)
+
+    def summary(self, project_name=None, user=None, hostname=None, chunksize=CHUNKSIZE):
+        """Aggregated results, computed by the database such that only the summary rows are loaded"""
+        summary = self.query(project_name=project_name, user=user, hostname=hostname, by=SUMMARY_KEYS)
+        return summary.astype({'count': 'int64'})
+
+    def delete(self):
+        with closing(self.connect()) as connection, connection:
+            connection.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+
+    def compact(self):
+        """Removes repeated writes of the same run (e.g., via flush), keeping the same one as deduplicate_runs, and returns their number"""
+        if not self.exists():
+            return 0
+        latest = f'SELECT rowid, ROW_NUMBER() OVER (PARTITION BY "run_id" ORDER BY "timestamp" DESC, rowid) AS rank FROM "{self.table}"'
+        with closing(self.connect()) as connection, connection:
+            deleted = connection.execute(f'DELETE FROM "{self.table}" WHERE rowid NOT IN (SELECT rowid FROM ({latest}) WHERE rank = 1)').rowcount
+        return deleted
+
+
+BACKENDS = {store.backend: store for store in [CSVResultsStore, ParquetResultsStore, SQLiteResultsStore]}
+
+
+def get_store(output_dir=DEFAULT_OUTPUT_DIR, backend='csv', shard=False, table='emissions'):
+    """Returns the results store of the given backend and table in the output directory"""
+    try:
+        return BACKENDS[backend](output_dir, shard, table)
+    except KeyError:
+        raise ValueError(f"[ResultsStore] Unknown backend '{backend}', please choose one of {list(BACKENDS.keys())}")
+
+
+def is_merged(output_dir):
+    """Checks whether the output directory is given as a list or glob pattern of several directories"""
+    return not isinstance(output_dir, (str, os.PathLike)) or glob.escape(str(output_dir)) != str(output_dir)
+
+
+def resolve_output_dirs(output_dir):
+    """Expands an output directory, a glob pattern or a list of both into the list of matching directories"""
+    patterns = [output_dir] if isinstance(output_dir, (str, os.PathLike)) else output_dir
+    output_dirs = []
+    for pattern in map(str, patterns):
+        matches = sorted(glob.glob(pattern)) if glob.escape(pattern) != pattern else [pattern]
+        output_dirs += [match for match in matches if match not in output_dirs]
+    return output_dirs
+
+
+def _read_source(output_dir, backend, columns, project_name, user, hostname, table):
+    store = get_store(output_dir, backend, table=table)
+    if not store.exists():
+        return None
+    results = store.read(columns, project_name, user, hostname)
+    results['source'] = output_dir
+    return results
+
+
+def read_merged(output_dirs, backend='csv', columns=None, project_name=None, user=None, hostname=None, table='emissions', max_workers=None):
+    """
+    Reads the results of several output directories (e.g., collected from many hosts) in parallel processes.
+    Rows are deduplicated on run_id via deduplicate_runs, and their output directory is kept as source column.
+    """
+    output_dirs = resolve_output_dirs(output_dirs)
+    read_columns = columns if columns is None else list(dict.fromkeys(list(columns) + ['run_id', 'timestamp']))
+    args = [(output_dir, backend, read_columns, project_name, user, hostname, table) for output_dir in output_dirs]
+    if len(output_dirs) > 1:
+        with ProcessPoolExecutor(max_workers) as executor:
+            sources = list(executor.map(_read_source, *zip(*args)))
+    else:
+        sources = [_read_source(*source_args) for source_args in args]
+    sources = [results for results in sources if results is not None]
+    if len(sources) == 0:
+        raise FileNotFoundError(f"[ResultsStore] No {table} results found in {output_dirs}")
+    # concatenating categories of different sources results in plain objects
+    results = apply_dtypes(pd.concat(sources, ignore_index=True))
+    results = results.astype({col: 'category' for col in ID_FIELDS + ['source'] if col in results.columns})
+    results = deduplicate_runs(results)
+    if columns is not None:
+        results = results.drop(columns=[col for col in ['run_id', 'timestamp'] if col not in columns])
+    return results
+
+
+def import_csv(csv_file, output_dir=DEFAULT_OUTPUT_DIR, backend='parquet', chunksize=CHUNKSIZE):
+    """Imports all results from an existing emissions.csv file into the given store"""
+    store = get_store(output_dir, backend)
+    for chunk in pd.read_csv(csv_file, chunksize=chunksize):
+        store.append(chunk)
+    return store
+
+
+def export_csv(csv_file, output_dir=DEFAULT_OUTPUT_DIR, backend='parquet', project_name=None, user=None, hostname=None):
+    """Exports the (filtered) results of the given store into a CodeCarbon-compatible CSV file"""
+    results = get_store(output_dir, backend).read(project_name=project_name, user=user, hostname=hostname)
+    results = results.drop(columns=[field for field in ID_FIELDS if field != 'project_name'])
+    results['project_name'] = results['experiment_id'].str.split(ID_SEPARATOR).str[0]
+    results = results[[col for col in STRING_COLUMNS + FLOAT_COLUMNS if col in results.columns]]
+    results.to_csv(csv_file, index=False)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manages the result storage backends, i.e., converts between emissions.csv files and other backends, or compacts separately written shards.")
+    parser.add_argument("--output_dir", type=str, default=DEFAULT_OUTPUT_DIR, help="Path to the output directory (default: ~/.let)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command, help in [("import", "Import a CSV file into the store"), ("export", "Export the store into a CSV file")]:
+        command_parser = commands.add_parser(command, help=help)
+        command_parser.add_argument("csv_file", type=str, nargs="+" if command == "import" else None, help="Path to the CSV file (or several files to import)")
+        command_parser.add_argument("--backend", type=str, default="parquet", choices=list(BACKENDS.keys()), help="Storage backend to import into or export from")
+    compact_parser = commands.add_parser("compact", help="Merge all per-process shards or segments into the main store, deduplicated on run_id")
+    compact_parser.add_argument("--backend", type=str, default="csv", choices=list(BACKENDS.keys()), help="Storage backend to compact")
+    compact_parser.add_argument("--table", type=str, default="emissions", choices=list(TABLES.keys()), help="Table to compact")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        for csv_file in args.csv_file:
+            import_csv(csv_file, args.output_dir, args.backend)
+            print(f'Imported {csv_file} into the {args.backend} store in {args.output_dir}')
+    elif args.command == "export":
+        results = export_csv(args.csv_file, args.output_dir, args.backend)
+        print(f'Exported {len(results)} results from the {args.backend} store in {args.output_dir} to {args.csv_file}')
+    else:
+        compacted = get_store(args.output_dir, args.backend, table=args.table).compact()
+        print(f'Compacted {compacted} {args.table} results of the {args.backend} store in {args.output_dir}')
@@ -1,25 +1,130 @@
 """
 Main tracker module that wraps CodeCarbon functionality
 """
+import dataclasses
+from functools import lru_cache
 import os
-from pathlib import Path
 import getpass
 import platform
+import time
 from typing import List, Optional
+import uuid
 
-from codecarbon import OfflineEmissionsTracker
-from codecarbon.external.logger import set_logger_level
-import pandas as pd
-
+from lamarr_energy_tracker import DEFAULT_OUTPUT_DIR
 from lamarr_energy_tracker.print_paper_statement import format_summary, load_results, print_paper_statement
 
-def delete_results(output_dir=None):
-    os.remove(os.path.join(output_dir, 'emissions.csv'))
+# codecarbon, pandas and the results stores are only imported once a tracker is started
+
+def delete_results(output_dir=DEFAULT_OUTPUT_DIR, backend='csv'):
+    from lamarr_energy_tracker.results_store import get_store
+    get_store(output_dir, backend).delete()
+
+class StoreOutput:
+    """CodeCarbon output handler that appends the results of each run to a results store, following the contract of CodeCarbon's BaseOutput"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def out(self, total, delta):
+        self.store.append([dict(total.values)])
+
+    def live_out(self, total, delta):
+        pass
+
+    def task_out(self, data, experiment_name):
+        pass
+
+    def exit(self):
+        pass
+
+MONITOR_POWER_SECS = 1 # interval of CodeCarbon's utilization monitoring
+
+@lru_cache(maxsize=None)
+def instrumented(tracker_class):
+    """
+    Subclass of the given CodeCarbon tracker class, which accounts the time spent for power measurements, estimates their integration error,
+    appends them to its power_trace and optionally adapts the measurement interval
+    """
+
+    class InstrumentedEmissionsTracker(tracker_class):
+        power_trace = None
+        sampling_seconds = 0.0
+        sampling_count = 0
+        sampling_error = 0.0 # kWh
+        last_power = None
+        last_measured = None
+        adaptive = None # (min_interval, max_interval, tolerance)
+        sampling_interval = None
+
+        def _measure_power_and_energy(self):
+            t_start = time.perf_counter()
+            super()._measure_power_and_energy()
+            t_end = time.perf_counter()
+            self.sampling_seconds += t_end - t_start
+            self.sampling_count += 1
+            power = self._cpu_power.W + self._gpu_power.W + self._ram_power.W
+            if self.last_power is not None:
+                # energy is integrated with the power at the end of each interval, which is off by up to half the power change times the interval
+                change = abs(power - self.last_power)
+                self.sampling_error += change * (t_end - self.last_measured) / 2 / 3.6e6
+                if self.adaptive is not None:
+                    self.adapt_interval(change / 2 / max(power, self.last_power, 1e-9))
+            self.last_power, self.last_measured = power, t_end
+            if self.power_trace is not None:
+                self.power_trace.append(time.time(), self._cpu_power.W, self._gpu_power.W, self._ram_power.W)
+
+        def adapt_interval(self, relative_error):
+            """Scales the interval such that the estimated relative integration error per interval stays close to the tolerance"""
+            min_interval, max_interval, tolerance = self.adaptive
+            factor = 2.0 if relative_error == 0 else min(2.0, max(0.5, 0.9 * tolerance / relative_error))
+            self.sampling_interval = min(max(self.sampling_interval * factor, min_interval), max_interval)
+            # the scheduler already re-armed its timer before measuring, so the new interval applies from the next measurement on
+            if self._scheduler is not None:
+                self._scheduler.interval = self.sampling_interval
+            # CodeCarbon polls the utilization (psutil and NVML) every second, which is slowed down along with the measurements
+            if getattr(self, '_scheduler_monitor_power', None) is not None:
+                self._scheduler_monitor_power.interval = max(self.sampling_interval, MONITOR_POWER_SECS)
+
+    InstrumentedEmissionsTracker.__name__ = f"Instrumented{tracker_class.__name__}"
+    return InstrumentedEmissionsTracker
+
+class Section:
+    """Named section of a running EnergyTracker, measured as the difference between two snapshots of its totals"""
+
+    def __init__(self, tracker, name, measure=False):
+        self.tracker = tracker
+        self.name = name
+        self.measure = measure
+        self.start = None
+        self.end = None
+
+    def __enter__(self):
+        self.start = self.tracker.snapshot(self.measure)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.end = self.tracker.snapshot(self.measure)
+        self.tracker.pending_sections.append(self)
+
+    @property
+    def result(self):
+        """The results of this section, in the format of CodeCarbon results"""
+        # the delta is only computed when the section is stored, to keep the section boundaries cheap
+        delta = dataclasses.replace(self.end)
+        delta.compute_delta_emission(self.start)
+        result = dict(delta.values)
+        # CodeCarbon reports the average power of the whole run, so it is derived from the energy of the section instead
+        for component in ['cpu', 'gpu', 'ram']:
+            result[f'{component}_power'] = result[f'{component}_energy'] * 3.6e6 / delta.duration if delta.duration > 0 else 0.0
+        result['run_id'] = str(uuid.uuid4())
+        result['parent_run_id'] = delta.run_id
+        result['section'] = self.name
+        return result
 
 class EnergyTracker:
     """A wrapper class for CodeCarbon's EmissionsTracker with simplified interface"""
     
-    def __init__(self, project_name="default", country_iso_code="DEU", measure_power_secs=1, output_dir=None, cuda_devices:Optional[List] = None):
+    def __init__(self, project_name="default", country_iso_code="DEU", measure_power_secs=1, output_dir=None, cuda_devices:Optional[List] = None, backend="csv", shard=False, trace=False, trace_capacity=86400, metrics_port=None, metrics_host='127.0.0.1', max_measure_power_secs=None, sampling_tolerance=0.01):
         """
         Initialize the energy tracker
         
@@ -28,20 +133,50 @@ class EnergyTracker:
             output_dir (str, optional): Directory to save the CodeCarbon logs
             country_iso_code (str, optional): ISO code of the country for emissions calculation
             measure_power_secs (float, optional): Interval in float to measure power consumption
+            max_measure_power_secs (float, optional): Adaptively increase the interval up to this bound while the power is steady, with measure_power_secs as lower bound
+            sampling_tolerance (float, optional): Estimated relative energy integration error per interval that the adaptive interval aims for
             cuda_devices (List, optional): List of cuda devices to track. If empty or None, will use CUDA_VISIBLE_DEVICES
+            backend (str, optional): Storage backend for the results, either "csv" (default), "parquet" or "sqlite"
+            shard (bool, optional): Write results to a separate shard per process, for safely running many trackers in parallel
+            trace (bool, optional): Record every power measurement into a trace file in output_dir/traces, named by the run_id
+            trace_capacity (int, optional): Number of power measurements kept in the trace file, older measurements are overwritten
+            metrics_port (int, optional): Serve the live energy and sampling overhead at http://HOST:PORT/metrics while the tracker is running (0 chooses a free port)
+            metrics_host (str, optional): Address the metrics endpoint binds, only reachable from this machine by default (e.g., "0.0.0.0" serves all interfaces)
         """
         self.project_name = project_name
+        self.country_iso_code = country_iso_code
+        self.measure_power_secs = measure_power_secs
+        self.max_measure_power_secs = max_measure_power_secs
+        self.sampling_tolerance = sampling_tolerance
         if output_dir is None:
-            output_dir = os.path.join(Path.home(), '.let')
+            output_dir = DEFAULT_OUTPUT_DIR
         os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.backend = backend
+        self.shard = shard
+        self.trace = trace
+        self.trace_capacity = trace_capacity
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.metrics_server = None
+        self.pending_sections = []
         self.user = getpass.getuser()
         self.hostname = platform.node()
-        experiment_id = f"{self.project_name}___{self.user}___{self.hostname}"
 
         if not cuda_devices: 
             if "CUDA_VISIBLE_DEVICES" in os.environ:
                 value = os.environ["CUDA_VISIBLE_DEVICES"]
                 cuda_devices = [d.strip() for d in value.split(",") if d.strip() != ""]
+        self.cuda_devices = cuda_devices
+        # the CodeCarbon tracker (with its hardware detection) is only created when starting
+        self.tracker = None
+
+    def create_tracker(self):
+        """Create the underlying CodeCarbon tracker"""
+        from codecarbon import OfflineEmissionsTracker
+        from codecarbon.external.logger import set_logger_level
+        from lamarr_energy_tracker.results_store import get_store
+        experiment_id = f"{self.project_name}___{self.user}___{self.hostname}"
 
         # Set the log_level here already otherwise we get stuff like 
         # [codecarbon INFO @ 12:21:08] offline tracker init
@@ -50,9 +185,18 @@ class EnergyTracker:
 
         # Additional, set the log_level=error here as well, otherwise this 
         # instances overrides our previous level with "" (aka level="info")
-        self.tracker = OfflineEmissionsTracker(
-            experiment_id=experiment_id, output_dir=output_dir, country_iso_code=country_iso_code, measure_power_secs=measure_power_secs, log_level="error", gpu_ids=cuda_devices
+        # Results are not written by CodeCarbon, which rewrites the whole CSV file
+        # on every run, but appended to our own results store.
+        tracker = instrumented(OfflineEmissionsTracker)(
+            experiment_id=experiment_id, output_dir=self.output_dir, country_iso_code=self.country_iso_code, measure_power_secs=self.measure_power_secs, log_level="error", gpu_ids=self.cuda_devices,
+            save_to_file=False, output_handlers=[StoreOutput(get_store(self.output_dir, self.backend, self.shard))]
         )
+        tracker.sampling_interval = self.measure_power_secs
+        if self.max_measure_power_secs is not None and self.max_measure_power_secs > self.measure_power_secs:
+            tracker.adaptive = (self.measure_power_secs, self.max_measure_power_secs, self.sampling_tolerance)
+            # CodeCarbon warns about delayed measurements after three times this interval
+            tracker._measure_power_secs = self.max_measure_power_secs
+        return tracker
         
     def __enter__(self):
         """Start tracking when used as a context manager"""
@@ -65,29 +209,119 @@ class EnergyTracker:
         
     def start(self):
         """Start tracking energy consumption"""
+        if self.tracker is None:
+            self.tracker = self.create_tracker()
+        if self.metrics_port is not None:
+            # the endpoint is bound first, such that nothing is left running if its port is already in use
+            from lamarr_energy_tracker.metrics import MetricsServer
+            self.metrics_server = MetricsServer(self.collect_metrics, self.metrics_host, self.metrics_port)
+        if self.trace:
+            from lamarr_energy_tracker.power_trace import PowerTrace
+            os.makedirs(os.path.dirname(self.trace_file), exist_ok=True)
+            self.tracker.power_trace = PowerTrace(self.trace_file, self.trace_capacity)
         self.tracker.start()
         
+    def section(self, name, measure=False):
+        """
+        Separately measure a named section of the running tracker, e.g., via `with tracker.section("train"):`
+        The results of all sections are stored when the tracker is stopped, linked to the results of the run.
+
+        Args:
+            name (str): Name of the section
+            measure (bool, optional): Additionally measure the power at the section boundaries, instead of only relying on the periodic measurements
+        """
+        return Section(self, name, measure)
+
+    def snapshot(self, measure=False):
+        """Current totals of the running tracker, without stopping it"""
+        if self.tracker is None or self.tracker._start_time is None:
+            raise RuntimeError("[EnergyTracker] Sections can only be measured after starting the tracker")
+        if measure:
+            # same as CodeCarbon's flush, which measures while the scheduler keeps running
+            self.tracker._measure_power_and_energy()
+        return self.tracker._prepare_emissions_data()
+
+    @property
+    def sampling(self):
+        """Number of power measurements, current interval (in seconds) and estimated energy integration error (in kWh) of the current run"""
+        if self.tracker is None:
+            return {'samples': 0, 'interval': self.measure_power_secs, 'estimated_error': 0.0}
+        return {'samples': self.tracker.sampling_count, 'interval': self.tracker.sampling_interval, 'estimated_error': self.tracker.sampling_error}
+
+    def collect_metrics(self):
+        """Metric families of the running tracker, which only read the totals of the last periodic measurement"""
+        labels = {'project': self.project_name, 'user': self.user, 'hostname': self.hostname}
+        components = ['cpu', 'gpu', 'ram']
+        return [
+            ('let_energy_consumed_kwh', 'gauge', 'Energy consumed since the tracker was started',
+             [(labels, self.tracker._total_energy.kWh)] + [(dict(labels, component=c), getattr(self.tracker, f'_total_{c}_energy').kWh) for c in components]),
+            ('let_power_watts', 'gauge', 'Power at the last measurement', [(dict(labels, component=c), getattr(self.tracker, f'_{c}_power').W) for c in components]),
+            ('let_sampling_duration_seconds', 'summary', 'Time spent for measuring the power',
+             [(labels, {'_sum': self.tracker.sampling_seconds, '_count': self.tracker.sampling_count})]),
+            ('let_sampling_interval_seconds', 'gauge', 'Current interval between power measurements', [(labels, self.tracker.sampling_interval)]),
+            ('let_sampling_error_kwh', 'gauge', 'Estimated error of integrating the energy from the power measurements', [(labels, self.tracker.sampling_error)]),
+        ]
+
     def stop(self, print_summary=True):
         """Stop tracking and return the total energy consumed in kWh"""
+        if self.tracker is None:
+            raise RuntimeError("[EnergyTracker] The tracker has to be started before stopping it")
         self.tracker.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server = None
+        if self.trace:
+            self.tracker.power_trace.close()
+            self.tracker.power_trace = None
+        if self.pending_sections:
+            from lamarr_energy_tracker.results_store import get_store
+            get_store(self.output_dir, self.backend, self.shard, table='sections').append([section.result for section in self.pending_sections])
+            self.pending_sections = []
         result = self.last_result
 
         if print_summary:
+            import pandas as pd
             _, _, en, _ = format_summary(pd.DataFrame([result]))
             print(f"\nTracker stopped - this experiment consumed {en}.\n")
-            print_paper_statement(output_dir=self.tracker._output_dir, project_name=self.project_name, user=self.user, hostname=self.hostname)
+            print_paper_statement(output_dir=self.output_dir, project_name=self.project_name, user=self.user, hostname=self.hostname, backend=self.backend)
         return result['energy_consumed'], result['duration']
     
+    @property
+    def trace_file(self):
+        """Path to the power trace file of the current run, if tracing is enabled"""
+        if not self.trace or self.tracker is None:
+            return None
+        return os.path.join(self.output_dir, 'traces', f'{self.tracker.run_id}.trace')
+
+    @property
+    def power_trace(self):
+        """Get the recorded power measurements of the current run, as NumPy structured array"""
+        from lamarr_energy_tracker.power_trace import load_power_trace
+        if self.trace_file is None:
+            raise RuntimeError("[EnergyTracker] Power traces are only recorded after starting a tracker with trace=True")
+        return load_power_trace(self.trace_file)
+
     @property
     def results(self):
         """Get all stored results"""
-        results = load_results(output_dir=self.tracker._output_dir, project_name=self.project_name, user=self.user, hostname=self.hostname)
+        results = load_results(output_dir=self.output_dir, project_name=self.project_name, user=self.user, hostname=self.hostname, backend=self.backend)
         return results
     
+    @property
+    def sections(self):
+        """Get all stored section results"""
+        return load_results(output_dir=self.output_dir, project_name=self.project_name, user=self.user, hostname=self.hostname, backend=self.backend, table='sections')
+
     @property
     def last_result(self):
-        """Get the last stored result"""
-        result = self.results.iloc[-1]
+        """Get the result of the last run, directly from CodeCarbon instead of reloading all stored results"""
+        emissions_data = getattr(self.tracker, 'final_emissions_data', None)
+        if emissions_data is None:
+            # not stopped yet, so fall back to the last stored result
+            return self.results.iloc[-1]
+        import pandas as pd
+        result = pd.Series(dict(emissions_data.values))
+        result['project_name'], result['user'], result['hostname'] = self.project_name, self.user, self.hostname
         return result
 
 if __name__ == "__main__":
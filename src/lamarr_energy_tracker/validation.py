@@ -0,0 +1,63 @@
+"""
+Validation of CodeCarbon estimates against the ground-truth energy measured by smart sockets
+"""
+import argparse
+
+import pandas as pd
+
+from lamarr_energy_tracker import DEFAULT_OUTPUT_DIR
+from lamarr_energy_tracker.print_paper_statement import load_results
+
+
+def _intervals(results, start):
+    """Start and end times of the given results, as well as plain string host names for joining"""
+    end = pd.to_datetime(results['timestamp'])
+    start = pd.to_datetime(results[start]) if start is not None else end - pd.to_timedelta(results['duration'], unit='s')
+    return pd.DataFrame({'hostname': results['hostname'].astype(str), 'start': start, 'end': end}, index=results.index)
+
+
+def match_groundtruth(estimates, groundtruth, tolerance=60):
+    """
+    Matches every CodeCarbon run to the latest ground-truth window of the same host that started before it (allowing
+    for tolerance seconds of clock skew between both trackers) and still overlaps with it, and reports the estimated
+    and measured energy as well as their ratio.
+    """
+    runs = _intervals(estimates, start=None).assign(run_id=estimates['run_id'].astype(str), estimated_energy=estimates['energy_consumed'].to_numpy())
+    windows = _intervals(groundtruth, start='start_time').assign(measured_energy=groundtruth['energy_consumed'].to_numpy())
+    windows = windows.rename(columns={'start': 'gt_start', 'end': 'gt_end'})
+    # windows that start slightly after the run (e.g., because the ground-truth tracking was started second) still match
+    windows['key'] = windows['gt_start'] - pd.Timedelta(seconds=tolerance)
+    # the as-of join requires both sides to be sorted by their time keys
+    matched = pd.merge_asof(
+        runs.sort_values('start'), windows.sort_values('key'), left_on='start', right_on='key', by='hostname', direction='backward'
+    ).drop(columns='key')
+    overlap = (matched[['end', 'gt_end']].min(axis=1) - matched[['start', 'gt_start']].max(axis=1)).dt.total_seconds()
+    unmatched = ~(overlap > 0)
+    matched.loc[unmatched, ['gt_start', 'gt_end', 'measured_energy']] = pd.NA
+    # share of the ground-truth window that is covered by the run, measurements of windows much longer than the run also include idle energy
+    matched['coverage'] = (overlap / (matched['gt_end'] - matched['gt_start']).dt.total_seconds()).where(~unmatched)
+    matched['ratio'] = matched['estimated_energy'] / matched['measured_energy']
+    return matched.sort_values('end').reset_index(drop=True)
+
+
+def compare_groundtruth(output_dir=DEFAULT_OUTPUT_DIR, project_name=None, user=None, hostname=None, backend='csv', tolerance=60):
+    """Loads the stored CodeCarbon and ground-truth results, and matches them via match_groundtruth"""
+    columns = ['timestamp', 'run_id', 'duration', 'energy_consumed']
+    estimates = load_results(output_dir, project_name, user, hostname, backend, columns=columns)
+    groundtruth = load_results(output_dir, project_name, user, hostname, backend, columns=columns + ['start_time'], table='groundtruth')
+    return match_groundtruth(estimates, groundtruth, tolerance)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the energy estimated by CodeCarbon with the ground-truth energy measured by smart sockets, for all runs with overlapping measurements.")
+    parser.add_argument("--output_dir", type=str, default=DEFAULT_OUTPUT_DIR, help="Path to the output directory (default: ~/.let)")
+    parser.add_argument("--project_name", type=str, default=None, help="Name of the project")
+    parser.add_argument("--user", type=str, default=None, help="User name")
+    parser.add_argument("--hostname", type=str, default=None, help="Hostname")
+    parser.add_argument("--backend", type=str, default="csv", help="Storage backend of the tracked results (e.g., csv, parquet or sqlite)")
+    parser.add_argument("--tolerance", type=float, default=60, help="Maximum clock skew (in seconds) by which a ground-truth window may start after its run")
+    args = parser.parse_args()
+
+    matched = compare_groundtruth(args.output_dir, args.project_name, args.user, args.hostname, args.backend, args.tolerance)
+    print(matched[['hostname', 'start', 'end', 'estimated_energy', 'measured_energy', 'ratio']].to_string(index=False))
+    print(f"\n{matched['ratio'].notna().sum()} of {len(matched)} runs matched, median ratio of estimated to measured energy: {matched['ratio'].median():.3f}")
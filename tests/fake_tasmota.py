@@ -0,0 +1,80 @@
+"""Local stand-in for a Tasmota smart socket"""
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from lamarr_energy_tracker.ground_truth_tracking import GT_FMT
+
+
+class FakeTasmotaHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1" # keep-alive
+
+    def do_GET(self):
+        device = self.server.device
+        cmnd = parse_qs(urlparse(self.path).query).get("cmnd", [""])[0]
+        with device.lock:
+            device.requests.append(cmnd)
+            device.connections.add(self.client_address)
+            device.in_flight += 1
+            device.max_in_flight = max(device.max_in_flight, device.in_flight)
+        try:
+            time.sleep(device.delay)
+            response = device.execute(cmnd)
+        finally:
+            with device.lock:
+                device.in_flight -= 1
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # the client gave up waiting
+
+    def log_message(self, *args):
+        return
+
+
+class FakeTasmota:
+    """Answers the Tasmota commands used by the tracking server, with a constant power draw and optional delay"""
+
+    def __init__(self, power=100.0, delay=0.0):
+        self.power = power # Watt
+        self.delay = delay # seconds per request
+        self.requests = []
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.offset = 0.0 # kWh
+        self.start_time = datetime.now() - timedelta(hours=1)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTasmotaHandler)
+        self.server.device = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self.server.server_address[1]}"
+
+    def total(self):
+        return self.offset + self.power * (datetime.now() - self.start_time).total_seconds() / 3600 / 1000
+
+    def execute(self, cmnd):
+        command, _, value = cmnd.partition(" ")
+        if command == "Status" and value == "8":
+            return {"StatusSNS": {"Time": datetime.now().strftime(GT_FMT), "ENERGY": {
+                "TotalStartTime": self.start_time.strftime(GT_FMT), "Total": round(self.total(), 5), "Power": self.power}}}
+        if command == "EnergyTotal":
+            self.offset, self.start_time = float(value), datetime.now()
+        return {command: value}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
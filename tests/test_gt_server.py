@@ -0,0 +1,240 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from lamarr_energy_tracker.ground_truth_tracking import GroundTruthTracker, GroundTruthTrackingServer, PowerSeries
+from lamarr_energy_tracker.print_paper_statement import load_results
+from tests.fake_tasmota import FakeTasmota
+
+
+@pytest.fixture
+def devices():
+    devices = {"slow": FakeTasmota(delay=0.2), "fast": FakeTasmota()}
+    yield devices
+    for device in devices.values():
+        device.close()
+
+
+@pytest.fixture
+def server(tmp_path, devices):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({host: device.address for host, device in devices.items()}))
+    server = GroundTruthTrackingServer(config_file, host="127.0.0.1", port=0, block=False)
+    yield f"http://127.0.0.1:{server.port}"
+    server.shutdown()
+
+
+def test_server_lists_and_tracks(server):
+    assert requests.get(f"{server}/list", timeout=5).json() == ["slow", "fast"]
+    start = requests.get(f"{server}/fast/start", timeout=5).json()
+    stop = requests.get(f"{server}/fast/stop", timeout=5).json()
+    assert start["energy_consumed"] > 0
+    assert stop["energy_consumed"] < start["energy_consumed"]
+    assert requests.get(f"{server}/unknown/start", timeout=5).status_code == 404
+
+
+def test_independent_hosts_do_not_block(server, devices):
+    slow = threading.Thread(target=requests.get, args=(f"{server}/slow/start",), kwargs={"timeout": 10})
+    slow.start()
+    time.sleep(0.1)
+
+    t_start = time.perf_counter()
+    for _ in range(3):
+        requests.get(f"{server}/fast/start", timeout=5).raise_for_status()
+    elapsed = time.perf_counter() - t_start
+
+    assert slow.is_alive(), "the slow host should still be busy"
+    assert elapsed < 0.2, "the fast host should not wait for the slow one"
+    slow.join()
+
+
+def test_same_socket_is_serialized(server, devices):
+    threads = [threading.Thread(target=requests.get, args=(f"{server}/slow/start",), kwargs={"timeout": 10}) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(devices["slow"].requests) == 4 # energy resolution is only set once
+    assert devices["slow"].max_in_flight == 1
+
+
+def test_queued_requests_keep_their_deadline(server, devices, monkeypatch):
+    devices["slow"].delay = 1.5
+    slow = threading.Thread(target=requests.get, args=(f"{server}/slow/start",), kwargs={"timeout": 10})
+    slow.start()
+    time.sleep(0.1)
+    # the time spent waiting for the other request to the same smart socket counts against the deadline
+    monkeypatch.setattr("lamarr_energy_tracker.ground_truth_tracking.REQUEST_BUDGET", 0.5)
+    t_start = time.perf_counter()
+    response = requests.get(f"{server}/slow/start", timeout=5)
+    assert time.perf_counter() - t_start < 1.0
+    assert response.status_code == 502 and response.json()["error"]["kind"] == "timeout"
+    assert "waiting" in response.json()["error"]["message"]
+    slow.join()
+
+
+def test_power_series_ring_buffer():
+    series = PowerSeries(capacity=4)
+    assert series.encode() == {"t0": None, "dt": [], "power": []}
+    for idx in range(6):
+        series.append(100.0 + idx, 10.0 * idx)
+
+    timestamps, power = series.since()
+    assert list(timestamps) == [102.0, 103.0, 104.0, 105.0]
+    assert list(power) == [20.0, 30.0, 40.0, 50.0]
+    assert series.encode(103.0) == {"t0": 104.0, "dt": [0, 1000], "power": [40.0, 50.0]}
+    assert len(series.timestamps) == 4
+    with pytest.raises(ValueError):
+        PowerSeries(capacity=0)
+
+
+def test_server_samples_power_series(tmp_path, devices):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"fast": devices["fast"].address}))
+    server = GroundTruthTrackingServer(config_file, host="127.0.0.1", port=0, block=False, sample_interval=0.02, series_capacity=5)
+    try:
+        time.sleep(0.3)
+        url = f"http://127.0.0.1:{server.port}/fast/series"
+        series = requests.get(url, timeout=5).json()
+        assert len(series["power"]) == 5, "the series should be bounded by its capacity"
+        assert set(series["power"]) == {100.0}
+
+        last = series["t0"] + series["dt"][-1] / 1000
+        newer = requests.get(url, params={"since": last}, timeout=5).json()
+        assert newer["t0"] is None or newer["t0"] > last
+        assert requests.get(url, params={"since": "abc"}, timeout=5).status_code == 400
+    finally:
+        server.shutdown()
+
+
+def test_client_requests_per_run(server, monkeypatch, tmp_path):
+    host, port = server.rsplit(":", 1)
+    monkeypatch.setenv("LET_GT_HOST", host.replace("http://", ""))
+    monkeypatch.setenv("LET_GT_PORT", port)
+    monkeypatch.setattr("socket.gethostname", lambda: "fast")
+    GroundTruthTracker.available_hosts.clear()
+    calls = []
+
+    class CountingSession(requests.Session):
+        def get(self, url, **kwargs):
+            calls.append(url)
+            return super().get(url, **kwargs)
+
+    monkeypatch.setattr(GroundTruthTracker, "session", CountingSession())
+
+    tracker = GroundTruthTracker(verbose=False, output_dir=tmp_path)
+    tracker.start()
+    tracker.stop()
+    assert len(calls) == 3
+    # further trackers use the cached host list, so each run only needs start and stop
+    tracker = GroundTruthTracker(verbose=False, output_dir=tmp_path)
+    tracker.start()
+    tracker.stop()
+    assert len(calls) == 5
+    # the results of both runs are stored
+    assert list(load_results(tmp_path, table="groundtruth")["hostname"]) == ["fast", "fast"]
+
+
+def test_bulk_commands_fan_out(tmp_path, monkeypatch):
+    devices = [FakeTasmota(delay=0.2) for _ in range(3)]
+    config = {
+        "node0": devices[0].address,
+        "node1": {"ip": devices[1].address, "groups": ["gpu"]},
+        "node2": {"ip": devices[2].address, "groups": ["gpu", "large"]},
+        "offline": {"ip": "127.0.0.1:1", "groups": ["large"]},
+    }
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(config))
+    server = GroundTruthTrackingServer(config_file, host="127.0.0.1", port=0, block=False)
+    try:
+        # all sockets are queried concurrently, so this takes about as long as a single host
+        start = time.perf_counter()
+        results = requests.get(f"http://127.0.0.1:{server.port}/start_all", timeout=10).json()
+        assert time.perf_counter() - start < 2 * 0.2 * 4
+        assert sorted(results["results"]) == ["node0", "node1", "node2"]
+        assert list(results["errors"]) == ["offline"]
+        assert results["errors"]["offline"]["kind"] == "unreachable"
+        response = requests.get(f"http://127.0.0.1:{server.port}/offline/stop", timeout=10)
+        assert response.status_code == 502 and response.json()["error"]["kind"] == "unreachable"
+
+        monkeypatch.setenv("LET_GT_HOST", "127.0.0.1")
+        monkeypatch.setenv("LET_GT_PORT", str(server.port))
+        monkeypatch.setattr("socket.gethostname", lambda: "node0")
+        tracker = GroundTruthTracker(verbose=False, project_name="cluster", output_dir=tmp_path)
+        results = tracker.stop_all(group="gpu")
+        assert sorted(results["results"]) == ["node1", "node2"] and not results["errors"]
+        assert results["results"]["node1"]["tracking_mode"] == "groundtruth"
+        assert "timestamp" in results["results"]["node2"]
+        stored = load_results(tmp_path, project_name="cluster", table="groundtruth")
+        assert sorted(stored["hostname"]) == ["node1", "node2"]
+        with pytest.raises(RuntimeError, match="unknown"):
+            tracker.stop_all(group="missing")
+    finally:
+        server.shutdown()
+        for device in devices:
+            device.close()
+
+
+def test_metrics_are_served_from_cache(server, devices):
+    requests.get(f"{server}/fast/start", timeout=5).raise_for_status()
+    requests.get(f"{server}/fast/stop", timeout=5).raise_for_status()
+    n_requests = len(devices["fast"].requests)
+    response = requests.get(f"{server}/metrics", timeout=5)
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert len(devices["fast"].requests) == n_requests, "scraping should not query the smart sockets"
+    metrics = dict(line.rsplit(" ", 1) for line in response.text.splitlines() if not line.startswith("#"))
+    assert float(metrics['let_gt_power_watts{host="fast"}']) == 100.0
+    assert float(metrics['let_gt_energy_consumed_kwh{host="fast"}']) >= 0.0
+    assert metrics['let_gt_query_duration_seconds_count{host="fast"}'] == "2.0"
+    assert metrics['let_gt_query_duration_seconds_count{host="slow"}'] == "0.0"
+    assert 'let_gt_power_watts{host="slow"}' not in metrics, "hosts without reads have no cached values"
+
+
+def test_non_blocking_commands(server, devices, monkeypatch, tmp_path):
+    host, port = server.rsplit(":", 1)
+    monkeypatch.setenv("LET_GT_HOST", host.replace("http://", ""))
+    monkeypatch.setenv("LET_GT_PORT", port)
+    monkeypatch.setattr("socket.gethostname", lambda: "slow")
+    GroundTruthTracker.available_hosts.clear()
+    tracker = GroundTruthTracker(verbose=False, output_dir=tmp_path)
+
+    t_start = time.perf_counter()
+    started = tracker.start(block=False)
+    stopped = tracker.stop(block=False)
+    assert time.perf_counter() - t_start < 0.1, "the commands should be sent in the background"
+    assert stopped.result(timeout=10)["timestamp"] >= started.result(timeout=10)["timestamp"]
+    assert stopped.result()["tracking_mode"] == "groundtruth"
+    assert devices["slow"].max_in_flight == 1
+
+    async def stop():
+        await asyncio.wrap_future(tracker.start(block=False))
+        return await asyncio.wrap_future(tracker.stop(block=False))
+    assert asyncio.run(stop())["energy_consumed"] >= 0
+    assert len(load_results(tmp_path, table="groundtruth")) == 2
+
+
+def test_overlapping_sessions(server, devices):
+    outer = requests.get(f"{server}/fast/start", timeout=5).json()
+    devices["fast"].offset += 0.5
+    inner = requests.get(f"{server}/fast/start", timeout=5).json()
+    devices["fast"].offset += 0.25
+    assert outer["session_id"] != inner["session_id"]
+    # sessions can be stopped in any order, without resetting the counter of the smart socket
+    stopped = requests.get(f"{server}/fast/stop", params={"session": outer["session_id"]}, timeout=5).json()
+    assert stopped["session_id"] == outer["session_id"]
+    assert 0.75 <= stopped["energy_consumed"] < 0.76
+    assert stopped["start_time"] == outer["timestamp"]
+    # without a session, the most recent session of the host is stopped
+    stopped = requests.get(f"{server}/fast/stop", timeout=5).json()
+    assert stopped["session_id"] == inner["session_id"] and 0.25 <= stopped["energy_consumed"] < 0.26
+    assert not any(cmnd.startswith("Energy") and cmnd != "EnergyRes 5" for cmnd in devices["fast"].requests)
+    response = requests.get(f"{server}/fast/stop", params={"session": inner["session_id"]}, timeout=5)
+    assert response.status_code == 404 and response.json()["error"]["kind"] == "unknown_session"
+    # without any session (e.g., after restarting the server), the energy of the run is unknown
+    response = requests.get(f"{server}/fast/stop", timeout=5)
+    assert response.status_code == 404 and response.json()["error"]["kind"] == "unknown_session"
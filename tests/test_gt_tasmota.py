@@ -2,12 +2,19 @@ import pytest
 from datetime import datetime
 from unittest.mock import patch, Mock
 
+import time
+
 from lamarr_energy_tracker.ground_truth_tracking import (
+    DEVICES,
+    DeviceError,
+    TasmotaDevice,
+    get_device,
     send_tasmota_query,
-    tasmota_start,
-    tasmota_stop,
+    energy_delta,
+    tasmota_read,
     GT_FMT
 )
+from tests.fake_tasmota import FakeTasmota
 
 
 MOCK_STATUS_RESPONSE = {
@@ -21,7 +28,14 @@ MOCK_STATUS_RESPONSE = {
 }
 
 
-@patch("requests.get")
+@pytest.fixture(autouse=True)
+def fresh_devices():
+    DEVICES.clear()
+    yield
+    DEVICES.clear()
+
+
+@patch("requests.Session.get")
 def test_send_tasmota_query_parses_response(mock_get):
     mock_response = Mock()
     mock_response.json.return_value = MOCK_STATUS_RESPONSE
@@ -35,35 +49,76 @@ def test_send_tasmota_query_parses_response(mock_get):
 
 
 @patch("lamarr_energy_tracker.ground_truth_tracking.send_tasmota_query")
-def test_tasmota_start_resets_and_returns(mock_query):
-
+def test_tasmota_read(mock_query):
     mock_query.side_effect = [
         None,                          # EnergyRes
-        {"timestamp": "2024-01-01T00:00:00",
-         "start_time": "2024-01-01T00:00:00",
-         "energy_consumed": 0,
-         "duration": 0},
-        None, None, None,              # reset commands
         {"timestamp": "2024-01-01T01:00:00",
          "start_time": "2024-01-01T00:00:00",
          "energy_consumed": 10,
-         "duration": 3600},
+         "duration": 3600}
     ]
 
-    result = tasmota_start("1.2.3.4")
+    result = tasmota_read("1.2.3.4")
+    assert result["duration"] == 3600
+    assert mock_query.call_count == 2
 
-    assert result["timestamp"] == "2024-01-01T01:00:00"
 
+def test_energy_delta():
+    start = {"timestamp": "2024-01-01T01:00:00", "start_time": "2024-01-01T00:00:00", "energy_consumed": 10.0, "duration": 3600}
+    end = {"timestamp": "2024-01-01T01:30:00", "start_time": "2024-01-01T00:00:00", "energy_consumed": 10.25, "duration": 5400}
+    delta = energy_delta(start, end)
+    assert delta["energy_consumed"] == 0.25
+    assert delta["start_time"] == "2024-01-01T01:00:00" and delta["duration"] == 1800
+    # a reset of the counter in between only leaves the energy since then
+    reset = dict(end, start_time="2024-01-01T01:20:00", energy_consumed=0.1)
+    delta = energy_delta(start, reset)
+    assert delta["counter_reset"] and delta["energy_consumed"] == 0.1 and delta["duration"] == 600
+
+
+def test_round_trips():
+    device = FakeTasmota()
+    try:
+        first = tasmota_read(device.address)
+        assert device.requests == ["EnergyRes 5", "Status 8"]
+        assert tasmota_read(device.address)["energy_consumed"] >= first["energy_consumed"], "counters should not be reset"
+        assert len(device.requests) == 3, "further reads should take a single round trip"
+        assert len(device.connections) == 1, "the keep-alive connection was not reused"
+    finally:
+        device.close()
+
+
+def test_dead_socket_opens_circuit_breaker(monkeypatch):
+    monkeypatch.setattr(TasmotaDevice, "BACKOFF", 0.01)
+    for _ in range(TasmotaDevice.FAILURE_THRESHOLD):
+        with pytest.raises(DeviceError) as error:
+            tasmota_read("127.0.0.1:1")
+        assert error.value.kind == "unreachable"
+    device = get_device("127.0.0.1:1")
+    assert device.circuit_open
+    assert device.latency.count == TasmotaDevice.FAILURE_THRESHOLD * (TasmotaDevice.RETRIES + 1)
+    # further queries fail fast, without contacting the socket
+    with pytest.raises(DeviceError) as error:
+        tasmota_read("127.0.0.1:1")
+    assert error.value.to_dict()["kind"] == "circuit_open"
+    assert device.latency.count == TasmotaDevice.FAILURE_THRESHOLD * (TasmotaDevice.RETRIES + 1)
+    # after the reset timeout, a successful probe closes the breaker again
+    fake = FakeTasmota()
+    try:
+        device.ip, device.opened_at = fake.address, time.monotonic() - TasmotaDevice.RESET_TIMEOUT
+        assert device.query("Status%208")["StatusSNS"]
+        assert not device.circuit_open and device.failures == 0
+    finally:
+        fake.close()
 
-@patch("lamarr_energy_tracker.ground_truth_tracking.send_tasmota_query")
-def test_tasmota_stop(mock_query):
-    mock_query.side_effect = [
-        None,
-        {"timestamp": "2024-01-01T01:00:00",
-         "start_time": "2024-01-01T00:00:00",
-         "energy_consumed": 10,
-         "duration": 3600}
-    ]
 
-    result = tasmota_stop("1.2.3.4")
-    assert result["duration"] == 3600
\ No newline at end of file
+def test_query_deadline(monkeypatch):
+    device = FakeTasmota(delay=0.5)
+    try:
+        t_start = time.perf_counter()
+        with pytest.raises(DeviceError) as error:
+            tasmota_read(device.address, budget=0.2)
+        assert error.value.kind == "timeout"
+        assert time.perf_counter() - t_start < 0.45, "the query should not wait longer than its deadline"
+        assert [bound for bound, count in get_device(device.address).latency.cumulative() if count > 0][0] <= 0.25
+    finally:
+        device.close()
@@ -8,7 +8,12 @@ from lamarr_energy_tracker.ground_truth_tracking import (
 )
 
 
-@patch("requests.get")
+@pytest.fixture(autouse=True)
+def clear_available_hosts():
+    GroundTruthTracker.available_hosts.clear()
+
+
+@patch("requests.Session.get")
 def test_all_available(mock_get):
 
     mock_response = Mock()
@@ -20,6 +25,12 @@ def test_all_available(mock_get):
 
     assert "host1" in result
 
+    # the host list is cached until it expires
+    assert GroundTruthTracker.all_available("localhost", "8000") == result
+    assert mock_get.call_count == 1
+    GroundTruthTracker.all_available("localhost", 8000, max_age=0)
+    assert mock_get.call_count == 2
+
 
 @patch("socket.gethostname", return_value="host1")
 @patch("lamarr_energy_tracker.ground_truth_tracking.GroundTruthTracker.all_available")
@@ -31,12 +42,10 @@ def test_is_available(mock_all_available, mock_hostname):
 
 
 @patch("socket.gethostname", return_value="host1")
-@patch("requests.get")
+@patch("requests.Session.get")
 @patch("lamarr_energy_tracker.ground_truth_tracking.GroundTruthTracker.is_available")
 def test_send_command_parses_datetime(mock_available, mock_get, mock_hostname):
 
-    mock_available.return_value = True
-
     mock_response = Mock()
     mock_response.raise_for_status.return_value = None
     mock_response.json.return_value = {
@@ -50,4 +59,20 @@ def test_send_command_parses_datetime(mock_available, mock_get, mock_hostname):
     result = GroundTruthTracker.send_command("localhost", "start", 8000)
 
     assert isinstance(result["start_time"], datetime)
-    assert result["duration"] == 3600
\ No newline at end of file
+    assert result["duration"] == 3600
+    # start and stop do not check the availability beforehand
+    mock_available.assert_not_called()
+    assert mock_get.call_count == 1
+
+
+@patch("socket.gethostname", return_value="host1")
+@patch("requests.Session.get")
+def test_send_command_unknown_host(mock_get, mock_hostname):
+
+    GroundTruthTracker.available_hosts[("localhost", "8000")] = (0, ["host1"])
+    mock_get.return_value = Mock(status_code=404)
+
+    with pytest.raises(RuntimeError, match="not available"):
+        GroundTruthTracker.send_command("localhost", "stop", 8000)
+    # the stale host list is dropped
+    assert not GroundTruthTracker.available_hosts
@@ -0,0 +1,50 @@
+import subprocess
+import sys
+
+import pytest
+
+
+def imported_modules(code):
+    """Runs the code in a fresh interpreter and returns the heavy modules that were imported"""
+    check = "import sys; print('imported:' + ','.join(sorted(mod for mod in ['pandas', 'numpy', 'codecarbon'] if mod in sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", f"{code}\n{check}"], capture_output=True, text=True, check=True)
+    return result.stdout.split("imported:")[-1].strip()
+
+
+@pytest.mark.parametrize("code", [
+    "import lamarr_energy_tracker",
+    "from lamarr_energy_tracker import EnergyTracker, GroundTruthTracker, print_custom_paper_statement",
+    "from lamarr_energy_tracker import EnergyTracker; EnergyTracker(output_dir='.let_test_lazy')",
+    "from lamarr_energy_tracker import print_custom_paper_statement; print_custom_paper_statement('CodeCarbon', 'CPU', 1.0)",
+])
+def test_no_heavy_imports(code, tmp_path):
+    assert imported_modules(code.replace(".let_test_lazy", str(tmp_path))) == ""
+
+
+def test_cli_custom_statement_without_pandas():
+    code = "import runpy, sys; sys.argv = ['let', '--methodology', 'CodeCarbon', '--hardware', 'CPU', '--consumed_energy', '1.0']; runpy.run_module('lamarr_energy_tracker.print_paper_statement', run_name='__main__')"
+    assert imported_modules(code) == ""
+
+
+def test_readme_usage(tmp_path):
+    from lamarr_energy_tracker.results_store import CSVResultsStore
+    CSVResultsStore(tmp_path).append([{
+        "timestamp": "2024-01-01T00:00:00", "run_id": "run", "experiment_id": "proj___alice___host1", "duration": 10.0,
+        "emissions": 0.001, "energy_consumed": 0.002, "codecarbon_version": "3.2.3", "cpu_model": "Intel CPU", "gpu_model": None,
+    }])
+    code = (
+        "from lamarr_energy_tracker import load_results, delete_results\n"
+        "from lamarr_energy_tracker.print_paper_statement import print_paper_statement\n"
+        f"assert len(load_results({str(tmp_path)!r})) == 1\n"
+        f"print_paper_statement({str(tmp_path)!r})\n"
+        f"delete_results({str(tmp_path)!r})"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert "on an Intel CPU is estimated to 2.000 Wh" in result.stdout
+    assert not (tmp_path / "emissions.csv").exists()
+
+
+def test_lazy_names_are_not_modules():
+    code = "import types, lamarr_energy_tracker as let; print('modules:' + ','.join(name for name in let.LAZY_IMPORTS if isinstance(getattr(let, name), types.ModuleType)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.split("modules:")[-1].strip() == ""
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from lamarr_energy_tracker import EnergyTracker
+from lamarr_energy_tracker.power_trace import PowerTrace, load_power_trace
+
+
+def test_trace_overwrites_oldest_samples(tmp_path):
+    path = str(tmp_path / 'run.trace')
+    trace = PowerTrace(path, capacity=4)
+    for idx in range(3):
+        trace.append(float(idx), 10.0 + idx, 0.0, 2.0)
+    assert len(trace) == 3
+    np.testing.assert_array_equal(load_power_trace(path)['timestamp'], [0, 1, 2])
+    for idx in range(3, 10):
+        trace.append(float(idx), 10.0 + idx, 0.0, 2.0)
+    trace.close()
+    samples = load_power_trace(path)
+    np.testing.assert_array_equal(samples['timestamp'], [6, 7, 8, 9])
+    np.testing.assert_array_equal(samples['cpu_power'], [16, 17, 18, 19])
+    # the file size is fixed by its capacity
+    assert (tmp_path / 'run.trace').stat().st_size == 32 + 4 * 32
+
+
+def test_trace_is_continued_when_reopened(tmp_path):
+    path = str(tmp_path / 'run.trace')
+    trace = PowerTrace(path, capacity=10)
+    trace.append(1.0, 1.0, 1.0, 1.0)
+    trace.close()
+    # the capacity of existing files is kept
+    trace = PowerTrace(path, capacity=100)
+    trace.append(2.0, 2.0, 2.0, 2.0)
+    trace.close()
+    assert trace.capacity == 10
+    np.testing.assert_array_equal(load_power_trace(path)['timestamp'], [1, 2])
+    (tmp_path / 'invalid.trace').write_bytes(b'timestamp,power\n')
+    with pytest.raises(ValueError):
+        PowerTrace(str(tmp_path / 'invalid.trace'))
+
+
+def test_tracker_records_power_trace(tmp_path):
+    tracker = EnergyTracker(project_name="test_trace", output_dir=str(tmp_path), measure_power_secs=0.1, trace=True, trace_capacity=1000)
+    with pytest.raises(RuntimeError):
+        tracker.power_trace
+    with tracker:
+        with tracker.section("measured", measure=True):
+            pass
+    samples = tracker.power_trace
+    assert tracker.trace_file == str(tmp_path / 'traces' / f'{tracker.tracker.run_id}.trace')
+    # at least the two section boundaries and the final measurement when stopping
+    assert len(samples) >= 3
+    assert np.all(np.diff(samples['timestamp']) >= 0)
+    assert np.all(samples['cpu_power'] >= 0)
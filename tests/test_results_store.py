@@ -0,0 +1,395 @@
+import multiprocessing
+import os
+import threading
+import time
+from unittest.mock import patch
+import pytest
+import pandas as pd
+
+from lamarr_energy_tracker.print_paper_statement import (
+    batch_paper_statements,
+    emission_comparisons,
+    load_results,
+    load_summary,
+    print_paper_statement,
+    write_batch_paper_statements
+)
+from lamarr_energy_tracker.results_store import (
+    CSVResultsStore,
+    ResultsStore,
+    aggregate_results,
+    deduplicate_runs,
+    filter_results,
+    get_store,
+    import_csv,
+    export_csv,
+    locked_file,
+    split_experiment_id
+)
+
+
+def make_rows(n, project="proj", user="alice", host="host1"):
+    return [{
+        "timestamp": f"2024-01-01T00:00:{idx:02d}",
+        "project_name": "codecarbon",
+        "run_id": f"run-{project}-{idx}",
+        "experiment_id": f"{project}___{user}___{host}",
+        "duration": 10.0,
+        "emissions": 0.001,
+        "energy_consumed": 0.002,
+        "codecarbon_version": "3.2.3",
+        "cpu_model": "Intel CPU",
+        "gpu_model": None,
+    } for idx in range(n)]
+
+
+def test_incomplete_backends_are_rejected(tmp_path):
+    class AppendOnlyStore(ResultsStore):
+        backend = 'append_only'
+
+        def append(self, rows):
+            pass
+
+    with pytest.raises(TypeError):
+        AppendOnlyStore(tmp_path)
+
+
+def test_csv_store_appends_and_filters(tmp_path):
+    store = CSVResultsStore(tmp_path)
+    store.append(make_rows(2))
+    store.append(make_rows(3, project="other"))
+
+    results = store.read()
+    assert len(results) == 5
+    assert (tmp_path / "emissions.csv").read_text().count("experiment_id") == 1
+
+    results = store.read(columns=["energy_consumed"], project_name="other")
+    assert len(results) == 3
+    assert set(results["project_name"]) == {"other"}
+    assert "cpu_model" not in results.columns
+
+
+def test_csv_store_backs_up_changed_format(tmp_path):
+    store = CSVResultsStore(tmp_path)
+    store.append(make_rows(1))
+    store.append([{key: val for key, val in row.items() if key != "gpu_model"} for row in make_rows(1)])
+
+    assert (tmp_path / "emissions.csv.bak").exists()
+    assert len(store.read()) == 1
+
+
+def test_split_experiment_id_is_categorical():
+    results = split_experiment_id(pd.DataFrame({"experiment_id": ["a___b___c", "a___y___c", None, "malformed"]}))
+
+    assert all(isinstance(results[field].dtype, pd.CategoricalDtype) for field in ["project_name", "user", "hostname"])
+    assert list(results["user"].iloc[:2]) == ["b", "y"] and results["user"].iloc[2:].isna().all()
+    assert results["project_name"].iloc[3] == "malformed"
+    assert list(filter_results(results, project_name="a", hostname="c").index) == [0, 1]
+    assert list(filter_results(results, project_name="a", user="y").index) == [1]
+
+
+def test_csv_store_uses_fixed_dtypes(tmp_path):
+    store = CSVResultsStore(tmp_path)
+    store.append(make_rows(3))
+
+    results = store.read(columns=["energy_consumed", "cpu_model", "run_id"])
+    assert results["energy_consumed"].dtype == "float64"
+    assert isinstance(results["cpu_model"].dtype, pd.CategoricalDtype)
+    assert not isinstance(results["run_id"].dtype, pd.CategoricalDtype)
+
+
+def test_unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        get_store(tmp_path, "unknown")
+
+
+def test_parquet_store_projection_and_pushdown(tmp_path):
+    pytest.importorskip("pyarrow")
+    store = get_store(tmp_path, "parquet")
+    assert len(store.read()) == 0
+    store.append(make_rows(2))
+    store.append(make_rows(3, project="other/project", host="host2"))
+
+    results = store.read(columns=["energy_consumed", "hostname"], project_name="other/project")
+    assert set(results.columns) == {"energy_consumed", "experiment_id", "project_name", "user", "hostname"}
+    assert len(results) == 3
+    assert set(results["hostname"]) == {"host2"}
+    assert store.read(hostname="host1")["gpu_model"].isna().all()
+
+
+def test_csv_import_export_roundtrip(tmp_path):
+    pytest.importorskip("pyarrow")
+    csv_file = tmp_path / "old_emissions.csv"
+    pd.DataFrame(make_rows(4)).to_csv(csv_file, index=False)
+
+    store = import_csv(csv_file, tmp_path, "parquet", chunksize=3)
+    assert len(store.read()) == 4
+
+    export_csv(tmp_path / "exported.csv", tmp_path, "parquet")
+    exported = pd.read_csv(tmp_path / "exported.csv")
+    assert sorted(exported["run_id"]) == sorted(row["run_id"] for row in make_rows(4))
+    assert set(exported["project_name"]) == {"proj"}
+
+
+def test_csv_summary_is_updated_incrementally(tmp_path):
+    store = CSVResultsStore(tmp_path)
+    store.append(make_rows(2))
+    summary = store.summary()
+    assert list(summary["count"]) == [2]
+    assert summary["energy_consumed"].iloc[0] == pytest.approx(0.004)
+
+    store.append(make_rows(3, host="host2"))
+    # an incompletely written row is ignored until it is finished
+    with open(tmp_path / "emissions.csv", "a") as af:
+        af.write("2024-01-01T00:00:00,codecarbon,partial")
+    summary = store.summary()
+    assert list(summary["hostname"]) == ["host1", "host2"]
+    assert list(summary["count"]) == [2, 3]
+    assert store.summary(hostname="host2")["emissions"].iloc[0] == pytest.approx(0.003)
+
+
+def test_csv_summary_is_invalidated(tmp_path):
+    store = CSVResultsStore(tmp_path)
+    store.append(make_rows(4))
+    assert store.summary()["count"].iloc[0] == 4
+
+    # rewriting the file with a different content of the same size invalidates the cache
+    content = (tmp_path / "emissions.csv").read_text()
+    (tmp_path / "emissions.csv").write_text(content.replace("alice", "bobby"))
+    assert list(store.summary()["user"]) == ["bobby"]
+
+    store.delete()
+    assert not (tmp_path / "emissions_summary.json").exists()
+    store.append(make_rows(1))
+    assert store.summary()["count"].iloc[0] == 1
+
+
+def test_csv_shards_are_read_and_compacted(tmp_path):
+    CSVResultsStore(tmp_path).append(make_rows(2))
+    writers = [CSVResultsStore(tmp_path, shard=True) for _ in range(3)]
+    for idx, writer in enumerate(writers):
+        writer.append(make_rows(2, project=f"sweep{idx}"))
+    # a shard left over from an interrupted compaction repeats runs that are already stored
+    writers[0].append(make_rows(1))
+
+    store = CSVResultsStore(tmp_path)
+    assert len(store.shards()) == 3
+    assert len(store.read(project_name="sweep1")) == 2
+    assert store.summary(project_name="sweep2")["count"].iloc[0] == 2
+
+    assert store.compact() == 6
+    assert store.shards() == []
+    results = store.read()
+    assert len(results) == 8
+    assert results["run_id"].is_unique
+    assert store.summary()["count"].sum() == 8
+
+
+def test_compaction_waits_for_running_writers(tmp_path):
+    writer = CSVResultsStore(tmp_path, shard=True)
+    writer.append(make_rows(1, project="first"))
+    store = CSVResultsStore(tmp_path)
+    with locked_file(writer.shard_path()) as wf:
+        compaction = threading.Thread(target=store.compact)
+        compaction.start()
+        time.sleep(0.2)
+        assert compaction.is_alive(), "the shard should only be compacted once its writer is done"
+        writer._write(wf, writer.shard_path(), pd.DataFrame(make_rows(1, project="second")))
+    compaction.join()
+    # the writer continues with a new shard, including its header
+    writer.append(make_rows(1, project="third"))
+    assert len(store.shards()) == 1
+    assert sorted(store.read()["project_name"]) == ["first", "second", "third"]
+
+
+def test_locked_file_reopens_replaced_files(tmp_path):
+    path = tmp_path / "shard.csv"
+    path.write_text("a\n1\n")
+    sizes = []
+    def append():
+        with locked_file(path) as wf:
+            sizes.append(os.fstat(wf.fileno()).st_size)
+    with locked_file(path, 'r'):
+        writer = threading.Thread(target=append)
+        writer.start()
+        time.sleep(0.2)
+        os.rename(path, tmp_path / "shard.csv.compacting")
+    writer.join()
+    assert sizes == [0], "the writer should not append to the renamed file"
+
+
+def test_deduplicate_runs_keeps_latest_write():
+    rows = pd.DataFrame(make_rows(2))
+    flushed = rows.iloc[[0]].assign(timestamp="2024-01-01T00:01:00", energy_consumed=0.005)
+    duplicate = rows.iloc[[1]].assign(energy_consumed=0.001)
+    deduplicated = deduplicate_runs(pd.concat([rows, flushed, duplicate])).sort_values("run_id")
+    assert list(deduplicated["energy_consumed"]) == [0.005, 0.002], "latest write per run, first one of equal timestamps"
+
+
+@pytest.mark.parametrize("backend", ["csv", "parquet", "sqlite"])
+def test_compaction_keeps_latest_write(tmp_path, backend):
+    if backend == "parquet":
+        pytest.importorskip("pyarrow")
+    rows = pd.DataFrame(make_rows(2))
+    get_store(tmp_path, backend).append(rows)
+    writer = get_store(tmp_path, backend, shard=True)
+    writer.append(rows.iloc[[0]].assign(timestamp="2024-01-01T00:01:00", energy_consumed=0.005))
+    writer.append(rows.iloc[[1]].assign(energy_consumed=0.001))
+
+    get_store(tmp_path, backend).compact()
+    stored = get_store(tmp_path, backend).read().sort_values("run_id")
+    assert list(stored["energy_consumed"]) == [0.005, 0.002]
+
+
+def append_sharded(output_dir, project, n_runs):
+    store = CSVResultsStore(output_dir, shard=True)
+    for row in make_rows(n_runs, project=project):
+        store.append([row])
+
+
+def test_csv_shards_of_concurrent_processes(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=append_sharded, args=(tmp_path, f"sweep{idx}", 20)) for idx in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    store = CSVResultsStore(tmp_path)
+    assert len(store.read()) == 80
+    assert store.compact() == 80
+    assert sorted(store.summary()["count"]) == [20, 20, 20, 20]
+
+
+def test_parquet_compaction(tmp_path):
+    pytest.importorskip("pyarrow")
+    store = get_store(tmp_path, "parquet")
+    for _ in range(3):
+        store.append(make_rows(2))
+    assert len(list(store._segments())) == 3
+
+    assert store.compact() == 2
+    assert len(list(store._segments())) == 1
+    assert len(store.read()) == 2
+
+
+def append_sqlite(output_dir, project, n_runs):
+    store = get_store(output_dir, "sqlite")
+    for row in make_rows(n_runs, project=project):
+        store.append([row])
+
+
+def test_sqlite_store_queries(tmp_path):
+    csv_file = tmp_path / "old_emissions.csv"
+    pd.DataFrame(make_rows(4) + make_rows(2, project="other", host="host2")).to_csv(csv_file, index=False)
+    store = import_csv(csv_file, tmp_path, "sqlite", chunksize=3)
+    store.append(make_rows(1, project="other"))
+
+    results = store.read(columns=["energy_consumed"], hostname="host2")
+    assert len(results) == 2 and set(results["project_name"]) == {"other"}
+    assert results["energy_consumed"].dtype == "float64" and isinstance(results["hostname"].dtype, pd.CategoricalDtype)
+    assert list(store.query(["run_id"], since="2024-01-01T00:00:01", until="2024-01-01T00:00:03", project_name="proj")["run_id"]) == ["run-proj-1", "run-proj-2"]
+    per_host = store.query(by=["hostname"])
+    assert list(per_host["hostname"]) == ["host1", "host2"] and list(per_host["count"]) == [5, 2]
+    # summaries are aggregated in SQL and match the ones of the CSV store
+    summary = load_summary(tmp_path, backend="sqlite")
+    assert list(summary["count"]) == [4, 2, 1]
+    assert summary["energy_consumed"].sum() == pytest.approx(0.014)
+    assert store.connect().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    indexes = {row[1] for row in store.connect().execute("PRAGMA index_list(emissions)")}
+    assert indexes == {f"emissions_{col}" for col in ["project_name", "user", "hostname", "timestamp", "run_id"]}
+
+    # only the latest of the three writes of run-other-0 is kept
+    store.append(make_rows(1, project="other"))
+    assert store.compact() == 2
+    assert len(get_store(tmp_path, "sqlite", table="sections").read()) == 0
+    store.delete()
+    assert not store.exists()
+
+
+def test_sqlite_concurrent_processes(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=append_sqlite, args=(tmp_path, f"sweep{idx}", 20)) for idx in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert sorted(get_store(tmp_path, "sqlite").summary()["count"]) == [20, 20, 20, 20]
+
+
+def test_summary_is_streamed_in_chunks(tmp_path):
+    pytest.importorskip("pyarrow")
+    rows = make_rows(7) + make_rows(5, host="host2")
+    csv_store, parquet_store = CSVResultsStore(tmp_path), get_store(tmp_path, "parquet")
+    csv_store.append(rows)
+    parquet_store.append(rows)
+
+    aggregated = aggregate_results(split_experiment_id(pd.DataFrame(rows)))
+    with patch("lamarr_energy_tracker.results_store.aggregate_results", wraps=aggregate_results) as mock_aggregate:
+        for store in [csv_store, parquet_store]:
+            summary = store.summary(chunksize=2)
+            assert list(summary["count"]) == list(aggregated["count"])
+            assert summary["energy_consumed"].tolist() == pytest.approx(aggregated["energy_consumed"].tolist())
+    # every chunk of (at most) two rows is aggregated separately
+    assert len([call for call in mock_aggregate.call_args_list if "count" not in call.args[0].columns]) >= 2 * 6
+
+
+def test_merge_output_dirs(tmp_path):
+    for idx in range(5):
+        (tmp_path / f"host{idx}").mkdir()
+    for idx in range(3):
+        CSVResultsStore(tmp_path / f"host{idx}").append(make_rows(2, project=f"proj{idx}", host=f"host{idx}"))
+    # results that were copied to another directory are only counted once
+    CSVResultsStore(tmp_path / "host3").append(make_rows(2, project="proj0", host="host0"))
+
+    results = load_results(str(tmp_path / "host*"))
+    assert len(results) == 6
+    assert results["run_id"].is_unique
+    assert set(results["source"]) == {str(tmp_path / f"host{idx}") for idx in range(3)}
+
+    results = load_results([tmp_path / "host1", str(tmp_path / "host3"), tmp_path / "host4"], columns=["energy_consumed"], hostname="host0")
+    assert set(results.columns) == {"energy_consumed", "experiment_id", "project_name", "user", "hostname", "source"}
+    assert len(results) == 2 and set(results["source"]) == {str(tmp_path / "host3")}
+
+    summary = load_summary(str(tmp_path / "*"))
+    assert summary["count"].sum() == 6
+    assert summary["energy_consumed"].sum() == pytest.approx(6 * 0.002)
+    with pytest.raises(FileNotFoundError):
+        load_results(str(tmp_path / "missing*"))
+
+
+def test_single_hardware_paper_statement(tmp_path):
+    CSVResultsStore(tmp_path).append(make_rows(2))
+
+    with patch("lamarr_energy_tracker.print_paper_statement.emission_comparisons", return_value=None):
+        output = print_paper_statement(tmp_path)
+    assert output.startswith("Using CodeCarbon 3.2.3, the energy consumption of running all experiments on an Intel CPU is estimated to 4.000 Wh."
+                             "This corresponds to estimated carbon emissions of 2.000 gCO2-equivalents, assuming a carbon intensity of 500 gCO2/kWh")
+
+
+def test_batch_paper_statements(tmp_path):
+    store = CSVResultsStore(tmp_path)
+    store.append(make_rows(2, project="proj_a") + make_rows(3, project="proj_b") + make_rows(1, project="proj_b", host="host2"))
+
+    with patch("lamarr_energy_tracker.print_paper_statement.emission_comparisons", wraps=emission_comparisons) as mock_comparisons:
+        statements = batch_paper_statements(tmp_path)
+    assert list(statements["project_name"]) == ["proj_a", "proj_b"]
+    assert list(statements["count"]) == [2, 4]
+    assert mock_comparisons.call_count == 2
+    assert "Intel CPU" in statements["statement"].iloc[0]
+
+    statements = batch_paper_statements(tmp_path, by=["project_name", "user", "hostname"])
+    assert len(statements) == 3
+    write_batch_paper_statements(statements, tmp_path / "statements")
+    table = pd.read_csv(tmp_path / "statements" / "paper_statements.csv")
+    assert list(table["count"]) == [2, 3, 1]
+    latex = (tmp_path / "statements" / "paper_statements.tex").read_text()
+    assert latex.count(r"\\") == 4 and r"proj\_b & alice & host2" in latex
+    assert (tmp_path / "statements" / "paper_statements.txt").read_text().count("% proj_") == 3
+
+    # configurations are separated unambiguously, as a single one may already join CPU and GPU
+    store.append([dict(row, cpu_model="AMD CPU", gpu_model="NVIDIA GPU") for row in make_rows(1, project="proj_c")] + make_rows(1, project="proj_c", host="host2"))
+    statements = batch_paper_statements(tmp_path, project_name="proj_c")
+    assert list(statements["project_name"]) == ["proj_c"]
+    assert statements["hardware"].iloc[0] == "AMD CPU and NVIDIA GPU; Intel CPU"
+    assert len(batch_paper_statements(tmp_path, by=["project_name", "user", "hostname"], hostname="host2")) == 2
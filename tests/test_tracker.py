@@ -1,5 +1,7 @@
 """Unit tests for the EnergyTracker class"""
+import math
 import os
+import shutil
 import tempfile
 import unittest
 from pathlib import Path
@@ -8,8 +10,9 @@ import socket
 import getpass
 from io import StringIO
 import sys
+from unittest.mock import patch
 from lamarr_energy_tracker import EnergyTracker
-from lamarr_energy_tracker.print_paper_statement import emission_comparisons, print_custom_paper_statement
+from lamarr_energy_tracker.print_paper_statement import emission_comparisons, format_summary, hardware_summary, print_combined_paper_statement, print_custom_paper_statement, statement_figures
 
 class TestEnergyTracker(unittest.TestCase):
 
@@ -20,9 +23,7 @@ class TestEnergyTracker(unittest.TestCase):
 
     def tearDown(self):
         """Clean up temporary files"""
-        for file in Path(self.temp_dir).glob("*.csv"):
-            file.unlink()
-        os.rmdir(self.temp_dir)
+        shutil.rmtree(self.temp_dir)
 
     def test_creates_emissions_csv(self):
         """Test if emissions.csv is created in the specified directory"""
@@ -65,8 +66,7 @@ class TestEnergyTracker(unittest.TestCase):
         
         emissions_file = custom_dir / "emissions.csv"
         self.assertTrue(emissions_file.exists(), "emissions.csv not created in custom directory")
-        os.remove(emissions_file)
-        os.rmdir(custom_dir)
+        shutil.rmtree(custom_dir)
 
     def test_stop_return_format(self):
         """Test if stop() returns properly formatted emissions data"""
@@ -85,6 +85,128 @@ class TestEnergyTracker(unittest.TestCase):
         # Check if duration is non-negative
         self.assertGreaterEqual(duration, 0, "Duration should be non-negative")
 
+    def test_stop_does_not_reload_results(self):
+        """Test if stop() takes the result of the run from CodeCarbon instead of the stored results"""
+        tracker = EnergyTracker(project_name=self.default_project, output_dir=self.temp_dir)
+        tracker.start()
+        with patch("lamarr_energy_tracker.tracker.load_results") as mock_load:
+            energy, duration = tracker.stop(print_summary=False)
+        mock_load.assert_not_called()
+
+        stored = tracker.results.iloc[-1]
+        self.assertEqual(tracker.last_result["run_id"], stored["run_id"], "Last result does not match the stored run")
+        self.assertTrue(math.isclose(energy, stored["energy_consumed"], rel_tol=1e-12), "Energy does not match the stored run")
+        self.assertEqual(tracker.last_result["hostname"], stored["hostname"], "Hostname does not match the stored run")
+
+    def test_metrics_endpoint(self):
+        """Test if the running tracker serves its live energy and sampling overhead"""
+        import requests
+        tracker = EnergyTracker(project_name=self.default_project, output_dir=self.temp_dir, measure_power_secs=0.1, metrics_port=0)
+        with tracker:
+            with tracker.section("measured", measure=True):
+                pass
+            response = requests.get(f"http://127.0.0.1:{tracker.metrics_server.port}/metrics", timeout=5)
+        self.assertIsNone(tracker.metrics_server, "the endpoint should be shut down when stopping")
+        metrics = dict(line.rsplit(" ", 1) for line in response.text.splitlines() if not line.startswith("#"))
+        labels = f'project="{self.default_project}",user="{getpass.getuser()}",hostname="{socket.gethostname()}"'
+        self.assertGreaterEqual(float(metrics[f'let_energy_consumed_kwh{{{labels}}}']), 0.0)
+        self.assertIn(f'let_power_watts{{{labels},component="cpu"}}', metrics)
+        self.assertGreaterEqual(float(metrics[f'let_sampling_duration_seconds_count{{{labels}}}']), 2)
+
+    def test_metrics_port_in_use(self):
+        """Test if the tracker is not started when the metrics endpoint cannot be bound"""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            sock.listen()
+            tracker = EnergyTracker(project_name=self.default_project, output_dir=self.temp_dir, metrics_port=sock.getsockname()[1])
+            with self.assertRaises(OSError):
+                tracker.start()
+        self.assertIsNone(tracker.tracker._start_time, "the CodeCarbon tracker should not be running")
+        self.assertIsNone(tracker.metrics_server)
+
+    def test_adaptive_sampling_interval(self):
+        """Test if the interval backs off during steady power and shrinks when power changes"""
+        from types import SimpleNamespace
+        from lamarr_energy_tracker.tracker import instrumented
+
+        class FakeTracker:
+            def __init__(self):
+                self._scheduler = SimpleNamespace(interval=1.0)
+                self._scheduler_monitor_power = SimpleNamespace(interval=1.0)
+                self._cpu_power, self._gpu_power, self._ram_power = [SimpleNamespace(W=w) for w in (100.0, 0.0, 10.0)]
+
+            def _measure_power_and_energy(self):
+                pass
+
+        tracker = instrumented(FakeTracker)()
+        tracker.adaptive, tracker.sampling_interval = (1.0, 30.0, 0.01), 1.0
+        for _ in range(10):
+            tracker._measure_power_and_energy()
+        self.assertEqual(tracker._scheduler.interval, 30.0)
+        self.assertEqual(tracker._scheduler_monitor_power.interval, 30.0, "Utilization monitoring should back off with the measurements")
+        self.assertEqual(tracker.sampling_error, 0.0)
+        tracker._cpu_power = SimpleNamespace(W=200.0)
+        tracker._measure_power_and_energy()
+        self.assertEqual(tracker._scheduler.interval, 15.0)
+        self.assertGreater(tracker.sampling_error, 0.0)
+        for _ in range(4):
+            tracker._cpu_power = SimpleNamespace(W=300.0 - tracker._cpu_power.W)
+            tracker._measure_power_and_energy()
+        self.assertEqual(tracker._scheduler.interval, 1.0)
+        self.assertEqual(tracker._scheduler_monitor_power.interval, 1.0)
+        self.assertEqual(tracker.sampling_count, 15)
+
+        with EnergyTracker(project_name=self.default_project, output_dir=self.temp_dir, measure_power_secs=0.05, max_measure_power_secs=0.5) as energy_tracker:
+            pass
+        self.assertGreaterEqual(energy_tracker.sampling['samples'], 1)
+        self.assertGreaterEqual(energy_tracker.sampling['estimated_error'], 0.0)
+
+    def test_parquet_backend(self):
+        """Test if results are appended to the parquet store instead of emissions.csv"""
+        try:
+            import pyarrow
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        for _ in range(2):
+            with EnergyTracker(project_name=self.default_project, output_dir=self.temp_dir, backend="parquet") as tracker:
+                pass
+
+        self.assertFalse((Path(self.temp_dir) / "emissions.csv").exists(), "emissions.csv should not be written")
+        self.assertEqual(len(tracker.results), 2, "Both runs should be stored")
+
+    def test_sqlite_backend(self):
+        """Test if results and sections are stored in the SQLite database, and the statement is printed from its summary"""
+        with patch('sys.stdout', new=StringIO()) as output:
+            with EnergyTracker(project_name=self.default_project, output_dir=self.temp_dir, backend="sqlite") as tracker:
+                with tracker.section("train"):
+                    pass
+
+        self.assertTrue((Path(self.temp_dir) / "results.sqlite").exists())
+        self.assertFalse((Path(self.temp_dir) / "emissions.csv").exists(), "emissions.csv should not be written")
+        self.assertEqual(len(tracker.results), 1)
+        self.assertEqual(list(tracker.sections["parent_run_id"]), list(tracker.results["run_id"]))
+        self.assertIn("the energy consumption of running all experiments", output.getvalue())
+
+    def test_sections(self):
+        """Test if sections are measured within a single run and stored linked to it"""
+        with EnergyTracker(project_name=self.default_project, output_dir=self.temp_dir) as tracker:
+            with tracker.section("load"):
+                sum(i * i for i in range(10000))
+            with tracker.section("train", measure=True):
+                sum(i * i for i in range(100000))
+
+        sections = tracker.sections
+        run = tracker.last_result
+        self.assertEqual(list(sections["section"]), ["load", "train"], "Sections should be stored in order")
+        self.assertTrue((sections["parent_run_id"] == run["run_id"]).all(), "Sections should be linked to the run")
+        self.assertTrue(sections["run_id"].is_unique, "Sections should have their own run ids")
+        self.assertLessEqual(sections["duration"].sum(), run["duration"], "Sections cannot take longer than the run")
+        self.assertLessEqual(sections["energy_consumed"].sum(), run["energy_consumed"] + 1e-12, "Sections cannot consume more than the run")
+        self.assertEqual(len(tracker.results), 1, "Sections should not be stored as separate runs")
+        with self.assertRaises(RuntimeError):
+            with EnergyTracker(project_name=self.default_project, output_dir=self.temp_dir).section("not started"):
+                pass
+
 
 class TestPaperStatementOutput(unittest.TestCase):
     """Test cases for print_custom_paper_statement output formatting"""
@@ -156,5 +278,36 @@ class TestPaperStatementOutput(unittest.TestCase):
         self.assertTrue(len(output) >= 1, "There where no emission_comparisons found for 100kg of CO2e, thats not possible")
         print(f"For comparison, this is {output[0]}. Comparisons are based on ``How bad are bananas? The Carbon Footprint of everything'' by Mike Berners-Lee. Greystone Books 2011.")
 
+    def test_mixed_hardware_statement(self):
+        """Test that results on several hardware configurations are summarized per configuration instead of rejected"""
+        results = pd.DataFrame({
+            "codecarbon_version": ["3.2.3"] * 4,
+            "cpu_model": ["Intel CPU @ 2.0GHz", "AMD CPU", "Intel CPU @ 2.0GHz", "AMD CPU"],
+            "gpu_model": [None, "NVIDIA GPU", None, "NVIDIA GPU"],
+            "energy_consumed": [0.1, 0.5, 0.1, 0.5],
+            "emissions": [0.05, 0.2, 0.05, 0.2],
+        })
+        groups = hardware_summary(results)
+        self.assertEqual([group["hardware"] for group in groups], ["Intel CPU", "AMD CPU and NVIDIA GPU"], "Hardware configurations should be kept in order")
+        self.assertEqual([group["count"] for group in groups], [2, 2], "Results should be counted per configuration")
+        self.assertEqual([group["rate"] for group in groups], [500, 400], "Carbon intensity should be computed per configuration")
+        with self.assertRaises(ValueError):
+            format_summary(results)
+
+        captured_output = StringIO()
+        sys.stdout = captured_output
+        try:
+            output = print_combined_paper_statement(groups)
+        finally:
+            sys.stdout = sys.__stdout__
+        self.assertIn("CodeCarbon 3.2.3", output, "Methodology missing in output")
+        self.assertIn("Intel CPU (0.200 kWh) and an AMD CPU and NVIDIA GPU (1.000 kWh)", output, "Energy per configuration missing in output")
+        self.assertIn("1.200 kWh", output, "Total energy missing in output")
+        self.assertIn("416 gCO2/kWh", output, "Overall carbon intensity missing in output")
+
+        # configurations without any consumed energy (e.g., very short runs) have no carbon intensity
+        groups = hardware_summary(results.assign(energy_consumed=0.0, emissions=0.0))
+        self.assertEqual(statement_figures(groups)[2:], (0.0, "Wh", 0))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from lamarr_energy_tracker.results_store import get_store
+from lamarr_energy_tracker.validation import compare_groundtruth, match_groundtruth
+
+
+def test_match_groundtruth():
+    estimates = pd.DataFrame({
+        "timestamp": ["2024-01-01T00:10:00", "2024-01-01T00:10:00", "2024-01-01T01:00:00", "2024-01-01T02:00:00"],
+        "run_id": ["a", "b", "c", "d"],
+        "hostname": ["host1", "host2", "host1", "host1"],
+        "duration": [600.0, 600.0, 600.0, 60.0],
+        "energy_consumed": [0.1, 0.2, 0.3, 0.4],
+    })
+    groundtruth = pd.DataFrame({
+        # the ground-truth tracking of both hosts was started a few seconds after the runs
+        "start_time": ["2024-01-01T00:00:05", "2024-01-01T00:00:03", "2024-01-01T00:50:00", "2024-01-01T03:00:00"],
+        "timestamp": ["2024-01-01T00:10:02", "2024-01-01T00:10:01", "2024-01-01T01:00:00", "2024-01-01T03:10:00"],
+        "hostname": ["host1", "host2", "host1", "host1"],
+        "energy_consumed": [0.2, 0.2, 0.25, 1.0],
+    })
+
+    matched = match_groundtruth(estimates, groundtruth, tolerance=10).set_index("run_id")
+    assert matched.loc["a", "measured_energy"] == 0.2 and matched.loc["a", "ratio"] == pytest.approx(0.5)
+    assert matched.loc["b", "ratio"] == pytest.approx(1.0)
+    assert matched.loc["c", "ratio"] == pytest.approx(1.2) and matched.loc["c", "coverage"] == pytest.approx(1.0)
+    # runs without a ground-truth window of the same host that overlaps them remain unmatched
+    assert pd.isna(matched.loc["d", "measured_energy"]) and pd.isna(matched.loc["d", "ratio"])
+
+
+def test_match_run_late_in_groundtruth_window():
+    estimates = pd.DataFrame({
+        "timestamp": ["2024-01-01T01:00:00"], "run_id": ["late"], "hostname": ["host1"], "duration": [3000.0], "energy_consumed": [0.5],
+    })
+    groundtruth = pd.DataFrame({
+        "start_time": ["2024-01-01T00:00:00"], "timestamp": ["2024-01-01T01:00:30"], "hostname": ["host1"], "energy_consumed": [1.0],
+    })
+
+    matched = match_groundtruth(estimates, groundtruth).set_index("run_id")
+    assert matched.loc["late", "measured_energy"] == 1.0 and matched.loc["late", "ratio"] == pytest.approx(0.5)
+    assert matched.loc["late", "coverage"] == pytest.approx(3000 / 3630)
+
+
+@pytest.mark.parametrize("backend", ["csv", "parquet", "sqlite"])
+def test_compare_stored_groundtruth(tmp_path, backend):
+    if backend == "parquet":
+        pytest.importorskip("pyarrow")
+    get_store(tmp_path, backend).append([{
+        "timestamp": "2024-01-01T00:10:00", "run_id": "run", "experiment_id": "proj___alice___host1",
+        "duration": 600.0, "emissions": 0.1, "energy_consumed": 0.3, "cpu_model": "Intel CPU",
+    }])
+    get_store(tmp_path, backend, table="groundtruth").append([{
+        "timestamp": "2024-01-01T00:10:01", "start_time": "2024-01-01T00:00:02", "run_id": "gt", "experiment_id": "proj___alice___host1",
+        "duration": 599.0, "energy_consumed": 0.2, "tracking_mode": "groundtruth",
+    }])
+
+    matched = compare_groundtruth(tmp_path, project_name="proj", backend=backend)
+    assert list(matched["run_id"]) == ["run"]
+    assert matched["ratio"].iloc[0] == pytest.approx(1.5)